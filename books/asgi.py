@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'books.settings')
+# без постоянных соединений по умолчанию, см. DATABASE_CONN_MAX_AGE в books.settings
+os.environ.setdefault('STORE_SERVER_INTERFACE', 'asgi')
 
 application = get_asgi_application()
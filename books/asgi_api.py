@@ -0,0 +1,19 @@
+"""
+ASGI config for API workers (books.settings_api).
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+URLconf and views are imported here, not on the first request, so a worker
+is ready to serve once the module is loaded.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+from django.urls import get_resolver
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'books.settings_api')
+# без постоянных соединений по умолчанию, см. DATABASE_CONN_MAX_AGE в books.settings
+os.environ.setdefault('STORE_SERVER_INTERFACE', 'asgi')
+
+application = get_asgi_application()
+get_resolver().url_patterns
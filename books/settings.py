@@ -43,17 +43,20 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'django_filters',
     'store',
 ]
 
 MIDDLEWARE = [
+    'store.instrumentation.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'store.routers.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -67,9 +70,33 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
-    ]
+    ],
+    # Authorization: Token ... (store.authentication) без запросов к БД
+    # на горячем пути. Сессии первыми: без входа ответ по-прежнему 403,
+    # а запрос без cookie сессии к БД не обращается
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+        'store.authentication.SignedTokenAuthentication',
+        'rest_framework.authentication.BasicAuthentication',
+    ],
+    # store.throttling.RelationWriteThrottle, счётчики хранятся в CACHES
+    'DEFAULT_THROTTLE_RATES': {
+        'relation_write': env('STORE_RELATION_WRITE_RATE', default='120/min'),
+    },
 }
 
+# Список /book/ строится из .values() без DRF-сериализатора (store.serializers.BooksFastSerializer)
+STORE_FAST_BOOK_LIST = env.bool('STORE_FAST_BOOK_LIST', default=False)
+# превышение бюджета SQL-запросов эндпоинта: исключение вместо предупреждения в логе
+STORE_QUERY_BUDGETS_STRICT = env.bool('STORE_QUERY_BUDGETS_STRICT', default=False)
+# PATCH /book_relation/ только ставит изменение в очередь (store.outbox),
+# применяет его команда process_relation_outbox
+STORE_RELATION_WRITE_BEHIND = env.bool('STORE_RELATION_WRITE_BEHIND', default=False)
+# срок жизни токенов POST /auth/token/ и кэш пользователей в памяти воркера
+STORE_TOKEN_MAX_AGE = env.int('STORE_TOKEN_MAX_AGE', default=60 * 60 * 24)
+STORE_AUTH_USER_CACHE_SIZE = env.int('STORE_AUTH_USER_CACHE_SIZE', default=1000)
+STORE_AUTH_USER_CACHE_SECONDS = env.int('STORE_AUTH_USER_CACHE_SECONDS', default=60)
+
 ROOT_URLCONF = 'books.urls'
 
 TEMPLATES = [
@@ -94,17 +121,59 @@ WSGI_APPLICATION = 'books.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Соединения постоянные: DATABASE_CONN_MAX_AGE секунд соединение переживает
+# запросы (0 - новое соединение на каждый запрос), а перед повторным
+# использованием проверяется (DATABASE_CONN_HEALTH_CHECKS).
+# Под ASGI (books.asgi, books.asgi_api выставляют STORE_SERVER_INTERFACE=asgi)
+# по умолчанию 0: синхронный код каждого запроса выполняется в своём потоке,
+# и постоянные соединения не переиспользовались бы, а копились до
+# CONN_MAX_AGE. Для переиспользования соединений под ASGI нужен пулер (pgbouncer).
+# За pgbouncer в режиме transaction pooling нужен DATABASE_PGBOUNCER=true:
+# серверные курсоры (QuerySet.iterator(), потоковый экспорт) не переживают
+# смену серверного соединения между транзакциями.
+
+SERVER_INTERFACE = env('STORE_SERVER_INTERFACE', default='wsgi')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': 'books_db',
+        'NAME': env('DATABASE_NAME', default='books_db'),
         'USER': env('DATABASE_USER'),
         'PASSWORD': env('DATABASE_PASSWORD'),
-        'HOST': '',
-        'PORT': '5432',
+        'HOST': env('DATABASE_HOST', default=''),
+        'PORT': env('DATABASE_PORT', default='5432'),
+        'CONN_MAX_AGE': env.int('DATABASE_CONN_MAX_AGE',
+                                default=0 if SERVER_INTERFACE == 'asgi' else 60),
+        'CONN_HEALTH_CHECKS': env.bool('DATABASE_CONN_HEALTH_CHECKS', default=True),
+        'DISABLE_SERVER_SIDE_CURSORS': env.bool('DATABASE_PGBOUNCER', default=False),
     }
 }
 
+# Реплики для чтения: DATABASE_REPLICA_HOSTS=replica1,replica2 (остальные
+# параметры как у default). Чтения GET-запросов уходят на реплики
+# (store.routers), пользователь после записи STORE_READ_YOUR_WRITES_SECONDS
+# читает из основной БД мимо кэша ответов. Это же время считается
+# максимальным отставанием реплик: столько после изменения книг ответы,
+# прочитанные с реплики, не кэшируются (store.cache).
+
+DATABASE_REPLICAS = []
+for index, host in enumerate(env.list('DATABASE_REPLICA_HOSTS', default=[])):
+    alias = f'replica_{index}'
+    DATABASES[alias] = dict(DATABASES['default'], HOST=host, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['store.routers.ReplicaRouter']
+STORE_READ_YOUR_WRITES_SECONDS = env.int('STORE_READ_YOUR_WRITES_SECONDS', default=5)
+
+
+# Cache
+# Ответы /book/ кэшируются (store.cache); в production нужен общий кэш,
+# например CACHE_URL=redis://127.0.0.1:6379/1
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
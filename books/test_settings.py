@@ -0,0 +1,28 @@
+"""
+Настройки для тестов: SQLite вместо PostgreSQL и реплика-зеркало
+основной БД, чтобы проверять маршрутизацию чтений (store.routers).
+
+python manage.py test store.tests --settings=books.test_settings
+"""
+import os
+
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ.setdefault('DATABASE_USER', '')
+os.environ.setdefault('DATABASE_PASSWORD', '')
+# тесты меняют связи чаще, чем разрешено в production
+os.environ.setdefault('STORE_RELATION_WRITE_RATE', '10000/min')
+
+from books.settings import *  # noqa: E402,F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_REPLICAS = ['replica']
@@ -15,15 +15,9 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from rest_framework.routers import SimpleRouter
 
-from store.views import BookViewSet, UserBookRelationView
-
-router = SimpleRouter()
-router.register('book', BookViewSet)
-router.register('book_relation', UserBookRelationView)
+from books.urls_api import urlpatterns as api_urlpatterns
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-] + router.urls
-
+] + api_urlpatterns
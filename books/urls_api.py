@@ -0,0 +1,22 @@
+"""URL API без админки, для books.settings_api; books.urls добавляет к ним admin/."""
+from django.urls import path
+from rest_framework.routers import SimpleRouter
+
+from store import async_views
+from store.views import BookViewSet, LeaderboardViewSet, LibraryViewSet, MetricsView, \
+    TokenView, UserBookRelationView
+
+router = SimpleRouter()
+router.register('book', BookViewSet)
+router.register('book_relation', UserBookRelationView)
+router.register('leaderboard', LeaderboardViewSet, basename='leaderboard')
+router.register('me/library', LibraryViewSet, basename='library')
+
+urlpatterns = [
+    path('auth/token/', TokenView.as_view(), name='auth-token'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('async/book/', async_views.book_list, name='async-book-list'),
+    path('async/book/<int:pk>/', async_views.book_detail, name='async-book-detail'),
+    path('async/book_relation/<int:book>/', async_views.book_relation,
+         name='async-book-relation'),
+] + router.urls
@@ -0,0 +1,17 @@
+"""
+WSGI config for API workers (books.settings_api).
+
+It exposes the WSGI callable as a module-level variable named ``application``.
+URLconf and views are imported here, not on the first request, so a worker
+is ready to serve once the module is loaded.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'books.settings_api')
+
+application = get_wsgi_application()
+get_resolver().url_patterns
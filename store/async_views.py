@@ -0,0 +1,86 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpResponse, JsonResponse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from store.filters import BookFilter
+from store.models import Book, UserBookRelation
+from store.outbox import flush_user_relations
+from store.routers import route_user
+from store.serializers import BooksFastSerializer
+
+ORDERING_FIELDS = ('price', 'author', 'rating')
+
+
+# Нативные async-вьюхи для чтения под ASGI: запросы идут через async ORM
+# (aiterator/aget), ответ строится BooksFastSerializer из строк .values()
+# и совпадает с ответом /book/.
+
+def render(data):
+	return HttpResponse(JSONRenderer().render(data), content_type='application/json')
+
+
+async def fetch_books(queryset):
+	rows = [row async for row in queryset.values(*BooksFastSerializer.value_fields).aiterator()]
+	if not rows:
+		return []
+	readers = BooksFastSerializer.readers_queryset([row['id'] for row in rows])
+	return BooksFastSerializer.build(rows, [reader async for reader in readers.aiterator()])
+
+
+async def book_list(request):
+	"""Список книг; поддерживает ?price= и ?ordering= как /book/."""
+	# filterset /book/: те же проверки цены и те же ошибки
+	filterset = BookFilter(request.GET, queryset=Book.objects.select_related('owner'))
+	if not filterset.is_valid():
+		return JsonResponse({name: list(errors) for name, errors in filterset.errors.items()},
+		                    status=400)
+	queryset = filterset.qs
+	ordering = [field for field in request.GET.get('ordering', '').split(',')
+	            if field.lstrip('-') in ORDERING_FIELDS]
+	if ordering:
+		queryset = queryset.order_by(*ordering)
+	return render(await fetch_books(queryset))
+
+
+async def book_detail(request, pk):
+	books = await fetch_books(Book.objects.filter(pk=pk))
+	if not books:
+		raise Http404
+	return render(books[0])
+
+
+def authenticate(request):
+	"""
+	Пользователь запроса по DEFAULT_AUTHENTICATION_CLASSES, как у DRF-вьюх:
+	в профиле API (books.settings_api) нет AuthenticationMiddleware и
+	request.user, там пользователь определяется только по токену.
+	"""
+	drf_request = Request(request, authenticators=[
+		authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+	user = drf_request.user
+	return user if user.is_authenticated else None
+
+
+async def book_relation(request, book):
+	"""Связь текущего пользователя с книгой (без создания записи, в отличие от PATCH)."""
+	try:
+		user = await sync_to_async(authenticate)(request)
+	except AuthenticationFailed as exc:
+		return JsonResponse({'detail': exc.detail}, status=exc.status_code)
+	if user is None:
+		return JsonResponse({'detail': 'Authentication credentials were not provided.'},
+		                    status=403)
+
+	await sync_to_async(route_user)(user)
+	await sync_to_async(flush_user_relations)(user)
+	fields = ('book', 'like', 'in_bookmarks', 'rate')
+	try:
+		relation = await UserBookRelation.objects.values(*fields).aget(user=user, book_id=book)
+	except UserBookRelation.DoesNotExist:
+		if not await Book.objects.filter(pk=book).aexists():
+			raise Http404
+		relation = {'book': book, 'like': False, 'in_bookmarks': False, 'rate': None}
+	return render(relation)
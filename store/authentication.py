@@ -0,0 +1,108 @@
+"""
+Аутентификация подписанным токеном без обращения к БД.
+
+Токен - подпись TimestampSigner над id пользователя и хешем его пароля
+(как у сессий Django): смена пароля отзывает выданные токены. Таблицы
+токенов нет, а пользователи держатся в user_cache процесса (TTL + LRU),
+поэтому аутентифицированный запрос обычно не делает ни одного запроса
+аутентификации. Изменение пользователя сбрасывает его запись в кэше
+текущего процесса (store.signals), в остальных процессах она устаревает
+не позже STORE_AUTH_USER_CACHE_SECONDS.
+
+	Authorization: Token <токен из POST /auth/token/>
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signing import BadSignature, SignatureExpired, TimestampSigner
+from django.utils.crypto import constant_time_compare
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+TOKEN_SALT = 'store.authentication.token'
+
+
+class UserCache:
+	"""Пользователи по id: не дольше ttl секунд, не больше maxsize записей (LRU)."""
+
+	def __init__(self, maxsize, ttl):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self.lock = threading.Lock()
+		self.users = OrderedDict()
+
+	def get(self, pk):
+		with self.lock:
+			entry = self.users.get(pk)
+			if entry is None:
+				return None
+			user, expires = entry
+			if expires < time.monotonic():
+				del self.users[pk]
+				return None
+			self.users.move_to_end(pk)
+			return user
+
+	def set(self, user):
+		with self.lock:
+			self.users[user.pk] = (user, time.monotonic() + self.ttl)
+			self.users.move_to_end(user.pk)
+			while len(self.users) > self.maxsize:
+				self.users.popitem(last=False)
+
+	def invalidate(self, pk):
+		with self.lock:
+			self.users.pop(pk, None)
+
+	def clear(self):
+		with self.lock:
+			self.users.clear()
+
+
+user_cache = UserCache(settings.STORE_AUTH_USER_CACHE_SIZE,
+                       settings.STORE_AUTH_USER_CACHE_SECONDS)
+
+
+def issue_token(user):
+	return TimestampSigner(salt=TOKEN_SALT).sign(f'{user.pk}:{user.get_session_auth_hash()}')
+
+
+def get_cached_user(pk):
+	"""Активный пользователь из user_cache или из БД; None, если его нет."""
+	user = user_cache.get(pk)
+	if user is None:
+		user = User.objects.filter(pk=pk, is_active=True).first()
+		if user is not None:
+			user_cache.set(user)
+	return user
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+	keyword = 'Token'
+
+	def authenticate(self, request):
+		auth = get_authorization_header(request).split()
+		if not auth or auth[0].lower() != self.keyword.lower().encode():
+			return None
+		if len(auth) != 2:
+			raise exceptions.AuthenticationFailed('Invalid token header.')
+
+		try:
+			value = TimestampSigner(salt=TOKEN_SALT).unsign(
+				auth[1].decode(), max_age=settings.STORE_TOKEN_MAX_AGE)
+		except SignatureExpired:
+			raise exceptions.AuthenticationFailed('Token has expired.')
+		except (BadSignature, UnicodeError):
+			raise exceptions.AuthenticationFailed('Invalid token.')
+
+		pk, _, password_hash = value.partition(':')
+		user = get_cached_user(int(pk))
+		if user is None or not constant_time_compare(password_hash, user.get_session_auth_hash()):
+			raise exceptions.AuthenticationFailed('Invalid token.')
+		return user, None
+
+	def authenticate_header(self, request):
+		return self.keyword
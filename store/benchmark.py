@@ -0,0 +1,196 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+
+from store.models import Book, UserBookRelation
+
+
+@contextmanager
+def rollback():
+	"""Выполняет блок в транзакции и откатывает её: бенчмарк не оставляет данных."""
+	with transaction.atomic():
+		yield
+		transaction.set_rollback(True)
+
+
+def seed_books(count, batch_size=10000, seed=0):
+	"""Быстро создаёт ``count`` книг через bulk_create со случайными счётчиками."""
+	rnd = random.Random(seed)
+	created = 0
+	while created < count:
+		size = min(batch_size, count - created)
+		books = []
+		for i in range(created, created + size):
+			rates_count = rnd.randint(0, 50)
+			rates_sum = sum(rnd.randint(1, 5) for _ in range(rates_count))
+			books.append(Book(
+				name=f'Book {i}',
+				author=f'Author {rnd.randint(1, count // 10 + 1)}',
+				price=Decimal(rnd.randint(100, 99999)) / 100,
+				likes_count=rnd.randint(0, 100),
+				rates_sum=rates_sum,
+				rates_count=rates_count,
+				rating=round(Decimal(rates_sum) / rates_count, 2) if rates_count else None,
+			))
+		Book.objects.bulk_create(books, batch_size=batch_size)
+		created += size
+
+
+def seed_users(count, batch_size=10000):
+	"""
+	Создаёт ``count`` пользователей и возвращает их id. Номера в именах
+	начинаются после наибольшего id: пользователь получает id не меньше
+	своего номера, поэтому повторный запуск с --keep не повторяет имена.
+	"""
+	first_id = (User.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+	users = [User(username=f'bench_user_{i}', first_name=f'Name {i}', last_name=f'Surname {i}')
+	         for i in range(first_id, first_id + count)]
+	User.objects.bulk_create(users, batch_size=batch_size)
+	return list(User.objects.filter(pk__gte=first_id, username__startswith='bench_user_')
+	            .order_by('pk').values_list('pk', flat=True))
+
+
+def seed_readers(book_ids, user_ids, per_book, batch_size=10000, seed=0):
+	"""Добавляет каждой книге ``per_book`` случайных читателей без лайков и оценок."""
+	rnd = random.Random(seed)
+	relations = []
+	for book_id in book_ids:
+		for user_id in rnd.sample(user_ids, min(per_book, len(user_ids))):
+			relations.append(UserBookRelation(book_id=book_id, user_id=user_id))
+		if len(relations) >= batch_size:
+			UserBookRelation.objects.bulk_create(relations)
+			relations = []
+	UserBookRelation.objects.bulk_create(relations)
+
+
+def seed_relations(book_ids, user_ids, count, skew=1.1, like_share=0.3, bookmark_share=0.1,
+                   rate_share=0.4, batch_size=10000, seed=0):
+	"""
+	Добавляет до ``count`` связей пользователь-книга. Книги выбираются по
+	закону Ципфа с показателем ``skew``: несколько популярных книг собирают
+	большую часть связей, как в реальном каталоге. Оценки смещены к 4-5.
+	Счётчики книг после этого нужно пересчитать (refresh_book_counters).
+	"""
+	rnd = random.Random(seed)
+	count = min(count, len(book_ids) * len(user_ids))
+	cum_weights, total = [], 0.0
+	for rank in range(1, len(book_ids) + 1):
+		total += 1 / rank ** skew
+		cum_weights.append(total)
+
+	pairs = set()
+	while len(pairs) < count:
+		books = rnd.choices(book_ids, cum_weights=cum_weights, k=count - len(pairs))
+		pairs.update(zip((rnd.choice(user_ids) for _ in books), books))
+
+	relations = []
+	for user_id, book_id in pairs:
+		rate = rnd.choices((1, 2, 3, 4, 5), weights=(1, 2, 4, 7, 6))[0] \
+			if rnd.random() < rate_share else None
+		relations.append(UserBookRelation(
+			user_id=user_id, book_id=book_id, rate=rate,
+			like=rnd.random() < like_share, in_bookmarks=rnd.random() < bookmark_share))
+	UserBookRelation.objects.bulk_create(relations, batch_size=batch_size)
+	return len(relations)
+
+
+def measure(func, repeat=5):
+	"""Возвращает лучшее время выполнения ``func`` в миллисекундах."""
+	timings = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func()
+		timings.append((time.perf_counter() - start) * 1000)
+	return min(timings)
+
+
+def percentiles(timings, points=(50, 95, 99)):
+	ordered = sorted(timings)
+	if not ordered:
+		return {f'p{point}': None for point in points}
+	return {f'p{point}': ordered[min(len(ordered) - 1, len(ordered) * point // 100)]
+	        for point in points}
+
+
+def count_queries(func):
+	"""Выполняет ``func`` и возвращает (результат, число SQL-запросов)."""
+	queries = []
+
+	def count(execute, sql, params, many, context):
+		queries.append(sql)
+		return execute(sql, params, many, context)
+
+	with connection.execute_wrapper(count):
+		result = func()
+	return result, len(queries)
+
+
+def client_load(request, requests):
+	"""
+	Выполняет ``request()`` ``requests`` раз подряд (тестовый Client).
+	Возвращает пропускную способность, число ответов не 2xx и перцентили
+	задержки успешных ответов в мс.
+	"""
+	timings = []
+	started = time.perf_counter()
+	for _ in range(requests):
+		start = time.perf_counter()
+		response = request()
+		if 200 <= response.status_code < 300:
+			timings.append((time.perf_counter() - start) * 1000)
+	elapsed = time.perf_counter() - started
+	return {
+		'requests': requests,
+		'errors': requests - len(timings),
+		'throughput': requests / elapsed,
+		**percentiles(timings),
+	}
+
+
+@contextmanager
+def unthrottled(throttle_class):
+	"""Снимает ограничение частоты ``throttle_class`` на время блока."""
+	rates, scope = throttle_class.THROTTLE_RATES, throttle_class.scope
+	rate = rates.get(scope)
+	# SimpleRateThrottle без частоты пропускает все запросы
+	rates[scope] = None
+	try:
+		yield
+	finally:
+		rates[scope] = rate
+
+
+def http_load(url, requests, concurrency, headers=None, timeout=30):
+	"""
+	Отправляет ``requests`` GET-запросов на ``url`` из ``concurrency`` потоков.
+	Возвращает пропускную способность и перцентили задержки в мс.
+	"""
+	def fetch(_):
+		start = time.perf_counter()
+		try:
+			with urlopen(Request(url, headers=headers or {}), timeout=timeout) as response:
+				response.read()
+			ok = True
+		except (URLError, OSError):
+			ok = False
+		return (time.perf_counter() - start) * 1000, ok
+
+	started = time.perf_counter()
+	with ThreadPoolExecutor(concurrency) as pool:
+		results = list(pool.map(fetch, range(requests)))
+	elapsed = time.perf_counter() - started
+
+	timings = [timing for timing, ok in results if ok]
+	return {
+		'requests': requests,
+		'errors': requests - len(timings),
+		'throughput': requests / elapsed,
+		**percentiles(timings),
+	}
@@ -0,0 +1,232 @@
+import threading
+import time
+from hashlib import md5
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from store.routers import in_recent_write, read_database
+
+GENERATION_KEY = 'store:books:generation'
+LIST_VERSION_KEY = 'store:books:list-version'
+BOOK_VERSION_KEY = 'store:book:{}:version'
+
+
+def new_version(changed_at=None):
+	"""Версия данных: время изменения и случайная часть."""
+	changed_at = time.time() if changed_at is None else changed_at
+	return f'{changed_at:.3f}-{uuid4().hex}'
+
+
+def version_changed_at(version):
+	try:
+		return float(version.split('-', 1)[0])
+	except ValueError:
+		return 0.0
+
+
+def get_versions(*keys):
+	"""Текущие версии ключей; отсутствующие версии создаются."""
+	versions = cache.get_many(keys)
+	# отсутствие версии не значит, что данные только что менялись
+	missing = {key: new_version(changed_at=0) for key in keys if key not in versions}
+	if missing:
+		cache.set_many(missing, None)
+		versions.update(missing)
+	return [versions[key] for key in keys]
+
+
+def invalidate_books(book_ids):
+	"""Сбрасывает закэшированные ответы списка и указанных книг."""
+	versions = {BOOK_VERSION_KEY.format(pk): new_version() for pk in book_ids}
+	versions[LIST_VERSION_KEY] = new_version()
+	cache.set_many(versions, None)
+
+
+def invalidate_books_on_commit(book_ids):
+	# второй сброс после коммита убирает ответы, закэшированные
+	# параллельными запросами до окончания транзакции
+	invalidate_books(book_ids)
+	transaction.on_commit(lambda: invalidate_books(book_ids))
+
+
+def invalidate_all_books():
+	"""Сбрасывает все закэшированные ответы: для изменений каталога в обход сигналов."""
+	cache.set(GENERATION_KEY, new_version(), None)
+
+
+def invalidate_all_books_on_commit():
+	invalidate_all_books()
+	transaction.on_commit(invalidate_all_books)
+
+
+class SingleFlight:
+	"""
+	Объединяет одновременные одинаковые вычисления в процессе: пока первый
+	поток вычисляет значение по ключу, остальные ждут его результат, а не
+	повторяют ту же работу.
+	"""
+
+	class Call:
+		def __init__(self):
+			self.done = threading.Event()
+			self.result = None
+			self.waiters = 0
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.calls = {}
+
+	def do(self, key, func, timeout=None):
+		"""
+		Возвращает (результат, shared). Если ``func`` первого потока упала
+		или не успела за ``timeout`` секунд, ожидающий поток вызывает её сам.
+		"""
+		with self.lock:
+			call = self.calls.get(key)
+			leader = call is None
+			if leader:
+				call = self.calls[key] = self.Call()
+			else:
+				call.waiters += 1
+
+		if not leader:
+			if call.done.wait(timeout) and call.result is not None:
+				return call.result, True
+			return func(), False
+
+		try:
+			call.result = func()
+		finally:
+			with self.lock:
+				del self.calls[key]
+			call.done.set()
+		return call.result, False
+
+
+in_flight = SingleFlight()
+
+
+class CachedResponseMixin:
+	"""
+	Кэширует ответы list/retrieve и отдаёт ETag.
+
+	Ключ кэша строится из URL запроса и версий данных: изменение книги или
+	связи с ней меняет версию (store.signals), поэтому старые записи просто
+	перестают читаться. ETag совпадает с ключом, и If-None-Match проверяется
+	без обращения к БД. Если задан last_modified_field, retrieve отдаёт
+	Last-Modified и отвечает 304 на If-Modified-Since.
+
+	Одновременные промахи кэша retrieve с одним ключом объединяются
+	(SingleFlight): ответ вычисляет один запрос, остальные получают его
+	данные.
+
+	Пока реплики могут отставать от основной БД (STORE_READ_YOUR_WRITES_SECONDS
+	после смены версии), ответы, прочитанные с реплики, не кэшируются и
+	отдаются без ETag: иначе устаревшие данные легли бы под новую версию.
+	Запросы недавно писавшего пользователя (store.routers) идут мимо кэша.
+	"""
+	response_cache_timeout = 60 * 5
+	last_modified_field = None
+	coalesce_retrieve = True
+	coalesce_timeout = 5
+
+	def list(self, request, *args, **kwargs):
+		return self.cached_response(super().list, LIST_VERSION_KEY,
+		                            request, *args, **kwargs)
+
+	def retrieve(self, request, *args, **kwargs):
+		# версию книги сбрасывают по её pk: /book/01/ должен попасть в ключ книги 1
+		try:
+			pk = self.queryset.model._meta.pk.to_python(
+				kwargs[self.lookup_url_kwarg or self.lookup_field])
+		except ValidationError:
+			return self.retrieve_response(request, *args, **kwargs)
+		return self.cached_response(self.retrieve_response, BOOK_VERSION_KEY.format(pk),
+		                            request, *args, coalesce=self.coalesce_retrieve, **kwargs)
+
+	def retrieve_response(self, request, *args, **kwargs):
+		instance = self.get_object()
+		response = Response(self.get_serializer(instance).data)
+		if self.last_modified_field is not None:
+			modified = getattr(instance, self.last_modified_field)
+			response['Last-Modified'] = http_date(modified.timestamp())
+		return response
+
+	def get_response_cache_key(self, request, versions):
+		params = sorted((key, value) for key, values in request.query_params.lists()
+		                for value in values)
+		parts = [request.get_host(), request.path, repr(params), *versions,
+		         *self.get_response_cache_vary(request)]
+		return 'store:response:v2:' + md5('\n'.join(parts).encode()).hexdigest()
+
+	def get_response_cache_vary(self, request):
+		"""Дополнительные части ключа для ответов, зависящих от пользователя."""
+		return []
+
+	def cached_response(self, handler, version_key, request, *args, coalesce=False, **kwargs):
+		if in_recent_write():
+			return handler(request, *args, **kwargs)
+
+		versions = get_versions(GENERATION_KEY, version_key)
+		key = self.get_response_cache_key(request, versions)
+		etag = f'"{key.rsplit(":", 1)[-1]}"'
+		if etag in parse_etags(request.headers.get('If-None-Match', '')):
+			return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+		cached = cache.get(key)
+		response = None
+		if cached is None:
+			cacheable = not self.replica_may_lag(versions)
+
+			def compute():
+				nonlocal response
+				response = handler(request, *args, **kwargs)
+				if response.status_code != status.HTTP_200_OK:
+					return None
+				value = (response.data, response.get('Last-Modified'))
+				if cacheable:
+					cache.set(key, value, self.response_cache_timeout)
+				return value
+
+			if coalesce:
+				cached, _ = in_flight.do(key, compute, self.coalesce_timeout)
+			else:
+				cached = compute()
+			if cached is None:
+				return response
+			if not cacheable:
+				etag = None
+
+		data, last_modified = cached
+		if response is None:
+			response = Response(data)
+
+		headers = {} if etag is None else {'ETag': etag}
+		if last_modified is not None:
+			headers['Last-Modified'] = last_modified
+			# If-None-Match, если передан, важнее If-Modified-Since
+			if 'If-None-Match' not in request.headers \
+					and not modified_since(request, last_modified):
+				return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+		for header, value in headers.items():
+			response[header] = value
+		return response
+
+	@staticmethod
+	def replica_may_lag(versions):
+		"""Чтение идёт с реплики, которая могла ещё не получить последнее изменение."""
+		changed_at = max(version_changed_at(version) for version in versions)
+		return time.time() - changed_at < settings.STORE_READ_YOUR_WRITES_SECONDS \
+			and read_database() != DEFAULT_DB_ALIAS
+
+
+def modified_since(request, last_modified):
+	since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+	return since is None or parse_http_date_safe(last_modified) > since
@@ -0,0 +1,82 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, IntegerField, Q, When
+from django.db.models.functions import Greatest
+from django_filters import FilterSet, NumberFilter
+from rest_framework.filters import SearchFilter
+
+from store.models import Book
+
+
+class BookFilter(FilterSet):
+	"""?price= как у колонки Book.price: NaN, бесконечность и лишние цифры - 400."""
+	price = NumberFilter(max_digits=7, decimal_places=2)
+
+	class Meta:
+		model = Book
+		fields = ['price']
+
+
+class BookSearchFilter(SearchFilter):
+	"""
+	Полнотекстовый поиск по книгам.
+
+	На PostgreSQL ищет по колонке search_vector (GIN-индекс, заполняется
+	триггером) и по триграммному сходству name/author, чтобы находить
+	запросы с опечатками, и сортирует результат по релевантности. Порог
+	сходства - настройка pg_trgm.similarity_threshold (по умолчанию 0.3):
+	оператор %, в отличие от сравнения similarity() с числом, использует
+	триграммный индекс.
+	На других СУБД (SQLite в тестах) отбирает книги обычным SearchFilter
+	и ранжирует их в Python.
+	"""
+	search_config = 'simple'
+
+	def filter_queryset(self, request, queryset, view):
+		search_fields = self.get_search_fields(view, request)
+		search_terms = self.get_search_terms(request)
+		if not search_fields or not search_terms:
+			return queryset
+
+		if connections[queryset.db].vendor == 'postgresql':
+			return self.full_text_search(queryset, search_fields, ' '.join(search_terms))
+		return self.python_search(request, queryset, view, search_fields, search_terms)
+
+	def full_text_search(self, queryset, search_fields, text):
+		query = SearchQuery(text, config=self.search_config, search_type='websearch')
+		similarity = Greatest(*(TrigramSimilarity(field, text) for field in search_fields))
+		similar = Q()
+		for field in search_fields:
+			similar |= Q(**{f'{field}__trigram_similar': text})
+
+		return queryset.annotate(
+			search_rank=SearchRank('search_vector', query),
+			search_similarity=similarity,
+		).filter(Q(search_vector=query) | similar).order_by(
+			'-search_rank', '-search_similarity', 'id')
+
+	def python_search(self, request, queryset, view, search_fields, search_terms):
+		queryset = super().filter_queryset(request, queryset, view)
+		rows = queryset.order_by().values_list('pk', *search_fields)
+		ranked = sorted(rows, key=lambda row: (-self.python_rank(row[1:], search_terms), row[0]))
+		if not ranked:
+			return queryset
+
+		position = Case(*(When(pk=row[0], then=index) for index, row in enumerate(ranked)),
+		                output_field=IntegerField())
+		return queryset.annotate(search_position=position).order_by('search_position', 'id')
+
+	@staticmethod
+	def python_rank(values, search_terms):
+		"""Чем раньше поле в search_fields и чем точнее совпадение, тем выше вес."""
+		rank = 0
+		for weight, value in enumerate(reversed(values), start=1):
+			words = (value or '').lower().split()
+			text = ' '.join(words)
+			for term in search_terms:
+				term = term.lower()
+				if term in words:
+					rank += 2 * weight
+				elif term in text:
+					rank += weight
+		return rank
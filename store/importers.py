@@ -0,0 +1,75 @@
+import csv
+import json
+from itertools import islice
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from store.cache import invalidate_all_books_on_commit
+from store.models import Book
+from store.serializers import BooksSerializer
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+
+def read_rows(lines, file_format):
+	"""
+	Построчно разбирает CSV (с заголовком) или JSON Lines.
+
+	Отдаёт тройки (номер строки, данные, ошибки разбора или None).
+	"""
+	if file_format == 'csv':
+		reader = csv.DictReader(lines)
+		for row in reader:
+			yield reader.line_num, row, None
+		return
+
+	for number, line in enumerate(lines, start=1):
+		if not line.strip():
+			continue
+		try:
+			row = json.loads(line)
+		except ValueError:
+			yield number, None, {'non_field_errors': ['Invalid JSON.']}
+			continue
+		if not isinstance(row, dict):
+			yield number, None, {'non_field_errors': ['Expected a JSON object.']}
+			continue
+		yield number, row, None
+
+
+def import_books(rows, owner, batch_size=1000, max_errors=100):
+	"""
+	Создаёт книги из потока строк read_rows пакетами по ``batch_size``.
+
+	Каждый пакет проверяется BooksSerializer(many=True) построчно:
+	невалидные строки попадают в отчёт и не мешают остальным.
+	"""
+	report = {'created': 0, 'invalid': 0, 'errors': []}
+	serializer = BooksSerializer(many=True)
+	rows = iter(rows)
+	while True:
+		chunk = list(islice(rows, batch_size))
+		if not chunk:
+			break
+
+		books = []
+		for number, data, errors in chunk:
+			if errors is None:
+				try:
+					validated = serializer.child.run_validation(data)
+				except ValidationError as exc:
+					errors = exc.detail
+				else:
+					books.append(Book(owner=owner, **validated))
+					continue
+			report['invalid'] += 1
+			if len(report['errors']) < max_errors:
+				report['errors'].append({'row': number, 'errors': errors})
+
+		with transaction.atomic():
+			# bulk_create не отправляет сигналы
+			Book.objects.bulk_create(books)
+			invalidate_all_books_on_commit()
+		report['created'] += len(books)
+	return report
@@ -0,0 +1,220 @@
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class QueryBudgetExceeded(Exception):
+	pass
+
+
+class RequestMetrics:
+	"""Число и время SQL-запросов и время этапов одного HTTP-запроса."""
+
+	def __init__(self):
+		self.queries = 0
+		self.db_time = 0.0
+		self.timings = {}
+		self.endpoint = None
+		self.query_budget = None
+		self.view_start_queries = 0
+
+	def __call__(self, execute, sql, params, many, context):
+		# подключается через connection.execute_wrapper
+		start = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			self.queries += 1
+			self.db_time += time.perf_counter() - start
+
+	@contextmanager
+	def timer(self, name):
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+	@property
+	def view_queries(self):
+		"""Запросы вьюхи без аутентификации и сессии."""
+		return self.queries - self.view_start_queries
+
+	def server_timing(self, total):
+		parts = [f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"']
+		parts += [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.timings.items()]
+		parts.append(f'total;dur={total * 1000:.1f}')
+		return ', '.join(parts)
+
+	def check_budget(self):
+		if self.query_budget is None or self.view_queries <= self.query_budget:
+			return
+		message = (f'{self.endpoint} made {self.view_queries} queries, '
+		           f'budget is {self.query_budget}')
+		if settings.STORE_QUERY_BUDGETS_STRICT:
+			raise QueryBudgetExceeded(message)
+		logger.warning(message)
+
+
+class Histogram:
+	def __init__(self, buckets):
+		self.buckets = buckets
+		self.counts = [0] * (len(buckets) + 1)
+		self.sum = 0.0
+
+	def observe(self, value):
+		self.sum += value
+		for index, bound in enumerate(self.buckets):
+			if value <= bound:
+				self.counts[index] += 1
+				return
+		self.counts[-1] += 1
+
+	def snapshot(self):
+		bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+		return {'buckets': dict(zip(bounds, self.counts)), 'sum': round(self.sum, 3)}
+
+
+class MetricsRegistry:
+	"""Гистограммы по эндпоинтам в памяти процесса."""
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.endpoints = {}
+
+	def observe(self, metrics, total):
+		values = {
+			'queries': (QUERY_BUCKETS, metrics.queries),
+			'db_ms': (TIME_BUCKETS_MS, metrics.db_time * 1000),
+			'total_ms': (TIME_BUCKETS_MS, total * 1000),
+		}
+		for name, seconds in metrics.timings.items():
+			values[f'{name}_ms'] = (TIME_BUCKETS_MS, seconds * 1000)
+
+		with self.lock:
+			endpoint = self.endpoints.setdefault(metrics.endpoint, {'count': 0, 'histograms': {}})
+			endpoint['count'] += 1
+			for name, (buckets, value) in values.items():
+				endpoint['histograms'].setdefault(name, Histogram(buckets)).observe(value)
+
+	def snapshot(self):
+		with self.lock:
+			return {name: {'count': endpoint['count'],
+			               **{key: histogram.snapshot()
+			                  for key, histogram in endpoint['histograms'].items()}}
+			        for name, endpoint in self.endpoints.items()}
+
+	def reset(self):
+		with self.lock:
+			self.endpoints.clear()
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+	"""
+	Считает SQL-запросы и время их выполнения для каждого запроса,
+	отдаёт их в заголовке Server-Timing и копит гистограммы в registry
+	для эндпоинтов, отмеченных InstrumentedViewMixin.
+	"""
+
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		# под ASGI цепочка остаётся асинхронной: без переходов sync/async на запрос
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		metrics = request.store_metrics = RequestMetrics()
+		start = time.perf_counter()
+		with self.wrap_connections(metrics):
+			response = self.get_response(request)
+		return self.finish(metrics, response, time.perf_counter() - start)
+
+	async def __acall__(self, request):
+		metrics = request.store_metrics = RequestMetrics()
+		start = time.perf_counter()
+		# соединения привязаны к потоку, а запросы выполняются в потоке
+		# sync_to_async (thread_sensitive), поэтому обёртку подключаем там
+		stack = await sync_to_async(self.wrap_connections)(metrics)
+		try:
+			response = await self.get_response(request)
+		finally:
+			await sync_to_async(stack.close)()
+		return self.finish(metrics, response, time.perf_counter() - start)
+
+	@staticmethod
+	def wrap_connections(metrics):
+		stack = ExitStack()
+		for connection in connections.all():
+			stack.enter_context(connection.execute_wrapper(metrics))
+		return stack
+
+	@staticmethod
+	def finish(metrics, response, total):
+		response['Server-Timing'] = metrics.server_timing(total)
+		if metrics.endpoint is not None:
+			registry.observe(metrics, total)
+		metrics.check_budget()
+		return response
+
+
+class InstrumentedViewMixin:
+	"""
+	Для DRF-вьюх: именует эндпоинт для метрик, замеряет сериализацию
+	и рендеринг и задаёт бюджет SQL-запросов для action.
+
+	query_budgets = {'list': 2} - при превышении запрос логируется, а при
+	STORE_QUERY_BUDGETS_STRICT (в тестах) падает с QueryBudgetExceeded.
+	Запросы аутентификации в бюджет не входят.
+	"""
+	query_budgets = {}
+
+	@property
+	def request_metrics(self):
+		return getattr(self.request._request, 'store_metrics', None)
+
+	def initial(self, request, *args, **kwargs):
+		super().initial(request, *args, **kwargs)
+		metrics = self.request_metrics
+		if metrics is not None:
+			metrics.endpoint = f'{self.basename}.{self.action}'
+			metrics.query_budget = self.query_budgets.get(self.action)
+			metrics.view_start_queries = metrics.queries
+
+	def get_serializer(self, *args, **kwargs):
+		serializer = super().get_serializer(*args, **kwargs)
+		metrics = self.request_metrics
+		if metrics is not None:
+			to_representation = serializer.to_representation
+
+			def timed_to_representation(instance):
+				with metrics.timer('serialize'):
+					return to_representation(instance)
+
+			serializer.to_representation = timed_to_representation
+		return serializer
+
+	def finalize_response(self, request, response, *args, **kwargs):
+		response = super().finalize_response(request, response, *args, **kwargs)
+		metrics = self.request_metrics
+		if metrics is not None and not getattr(response, 'is_rendered', True):
+			with metrics.timer('render'):
+				response.render()
+		return response
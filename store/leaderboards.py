@@ -0,0 +1,79 @@
+"""
+Рейтинги книг для главной страницы.
+
+Сортировка всего каталога выполняется только при пересчёте
+(refresh_leaderboards, команда refresh_leaderboards по расписанию),
+а эндпоинт /leaderboard/<board>/ читает первые позиции из BookRank
+по индексу (board, position).
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, FloatField, Q, Sum, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from store.models import Book, BookRank, BookStats, UserBookRelation
+
+LEADERBOARD_SIZE = 100
+# вес априорной средней оценки в байесовском рейтинге, в голосах
+RATED_PRIOR_VOTES = 5
+TRENDING_DAYS = 7
+
+
+def most_liked(size):
+	books = Book.objects.filter(likes_count__gt=0).order_by('-likes_count', 'id')
+	return books.values_list('id', 'likes_count')[:size]
+
+
+def highest_rated(size, prior_votes=RATED_PRIOR_VOTES):
+	"""
+	Байесовская средняя: (C * m + сумма оценок) / (C + число оценок), где m -
+	средняя оценка по всем книгам, а C = ``prior_votes``. Книги с парой
+	высоких оценок не обгоняют книги с большим числом голосов.
+	"""
+	totals = Book.objects.aggregate(rates_sum=Sum('rates_sum'), rates_count=Sum('rates_count'))
+	if not totals['rates_count']:
+		return []
+	mean = totals['rates_sum'] / totals['rates_count']
+	score = (Value(prior_votes * mean) + Cast('rates_sum', FloatField())) \
+		/ (Value(float(prior_votes)) + Cast('rates_count', FloatField()))
+	books = Book.objects.filter(rates_count__gt=0).annotate(score=score) \
+		.order_by('-score', 'id')
+	return books.values_list('id', 'score')[:size]
+
+
+def most_bookmarked(size):
+	stats = BookStats.objects.filter(bookmarks__gt=0).order_by('-bookmarks', 'book_id')
+	return stats.values_list('book_id', 'bookmarks')[:size]
+
+
+def trending(size, days=TRENDING_DAYS):
+	"""Книги, которые чаще всего лайкали, добавляли в закладки или оценивали за ``days`` дней."""
+	since = timezone.now() - timedelta(days=days)
+	relations = UserBookRelation.objects.filter(updated_at__gte=since).filter(
+		Q(like=True) | Q(in_bookmarks=True) | Q(rate__isnull=False))
+	return relations.values('book').annotate(score=Count('pk')) \
+		.order_by('-score', 'book').values_list('book', 'score')[:size]
+
+
+BOARDS = {
+	BookRank.LIKED: most_liked,
+	BookRank.RATED: highest_rated,
+	BookRank.BOOKMARKED: most_bookmarked,
+	BookRank.TRENDING: trending,
+}
+
+
+def refresh_leaderboards(boards=None, size=LEADERBOARD_SIZE):
+	"""Пересчитывает BookRank для ``boards`` (по умолчанию всех). Возвращает {board: позиций}."""
+	result = {}
+	for board in boards or BOARDS:
+		ranks = [BookRank(board=board, position=position, book_id=book_id, score=score)
+		         for position, (book_id, score) in enumerate(BOARDS[board](size), start=1)]
+		# читатели видят либо старый, либо новый рейтинг целиком
+		with transaction.atomic():
+			BookRank.objects.filter(board=board).delete()
+			BookRank.objects.bulk_create(ranks)
+		result[board] = len(ranks)
+	return result
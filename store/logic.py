@@ -0,0 +1,261 @@
+from collections import Counter
+
+from django.db.models import (Case, Count, DecimalField, Exists, F, FilteredRelation,
+                              FloatField, IntegerField, OuterRef, Prefetch, Q,
+                              Subquery, Sum, Value, When)
+from django.db.models.functions import Cast, Coalesce, Now
+
+from store.cache import invalidate_books_on_commit
+from store.models import Book, BookStats, UserBookRelation
+
+COUNTED_FIELDS = {'book_id', 'like', 'in_bookmarks', 'rate'}
+EMPTY_RELATION = {'like': False, 'in_bookmarks': False, 'rate': None}
+
+
+def rating_expression():
+	"""Средняя оценка из сохранённых rates_sum / rates_count."""
+	return Case(
+		When(rates_count=0, then=None),
+		default=Cast('rates_sum', FloatField()) / F('rates_count'),
+		output_field=DecimalField(max_digits=3, decimal_places=2))
+
+
+def stats_changes(old, new):
+	changes = {
+		'likes': int(new['like']) - int(old['like']),
+		'bookmarks': int(new['in_bookmarks']) - int(old['in_bookmarks']),
+	}
+	if old['rate'] != new['rate']:
+		if old['rate'] is not None:
+			changes[BookStats.rate_field(old['rate'])] = -1
+		if new['rate'] is not None:
+			changes[BookStats.rate_field(new['rate'])] = 1
+	return changes
+
+
+def apply_relation_change(old, new):
+	"""
+	Переносит изменение связи пользователь-книга в счётчики и BookStats книги.
+
+	``old`` и ``new`` - словари с ключами book_id, like, in_bookmarks, rate; None означает,
+	что связь только что создана или удалена.
+	"""
+	# появление или удаление связи меняет читателей книги
+	touch = old is None or new is None
+	if old is None:
+		old = dict(EMPTY_RELATION, book_id=new['book_id'])
+	if new is None:
+		new = dict(EMPTY_RELATION, book_id=old['book_id'])
+	if not COUNTED_FIELDS <= old.keys():
+		# связь загружена через only/defer - старые значения неизвестны
+		refresh_book_counters(Book.objects.filter(pk=new['book_id']))
+		return
+	if old['book_id'] != new['book_id']:
+		apply_relation_change(old, None)
+		apply_relation_change(None, new)
+		return
+
+	deltas = BookDeltas()
+	deltas.add(old, new, touch)
+	deltas.apply()
+
+
+class BookDeltas:
+	"""
+	Изменения счётчиков и BookStats, накопленные по книгам: сколько бы связей
+	книги ни изменилось, каждая книга обновляется одним сдвигом счётчиков и
+	одним сдвигом BookStats, без пересчёта по всем её связям.
+	"""
+
+	def __init__(self):
+		self.books = {}
+
+	def add(self, old, new, touch=False):
+		"""``old`` и ``new`` - как в apply_relation_change, с одной и той же книгой."""
+		touch = touch or old is None or new is None
+		# book_id связи может быть строкой из URL
+		book_id = Book._meta.pk.to_python((new or old)['book_id'])
+		old, new = old or EMPTY_RELATION, new or EMPTY_RELATION
+		delta = self.books.setdefault(book_id, {
+			'likes': 0, 'rates_sum': 0, 'rates_count': 0, 'touch': False, 'stats': Counter()})
+		changes = stats_changes(old, new)
+		delta['likes'] += int(new['like']) - int(old['like'])
+		delta['rates_sum'] += (new['rate'] or 0) - (old['rate'] or 0)
+		delta['rates_count'] += int(new['rate'] is not None) - int(old['rate'] is not None)
+		delta['touch'] |= touch or any(changes.values())
+		delta['stats'].update(changes)
+
+	def apply(self):
+		"""Применяет изменения всех книг несколькими запросами, независимо от числа книг."""
+		counters = ('likes', 'rates_sum', 'rates_count')
+		changed = {book_id: delta for book_id, delta in self.books.items()
+		           if delta['touch'] or any(delta[field] for field in counters)}
+		if changed:
+			books = Book.objects.filter(pk__in=changed)
+			books.update(likes_count=F('likes_count') + self.shift(changed, 'likes'),
+			             rates_sum=F('rates_sum') + self.shift(changed, 'rates_sum'),
+			             rates_count=F('rates_count') + self.shift(changed, 'rates_count'),
+			             updated_at=Now())
+			rated = [book_id for book_id, delta in changed.items()
+			         if delta['rates_sum'] or delta['rates_count']]
+			if rated:
+				Book.objects.filter(pk__in=rated).update(rating=rating_expression())
+
+		stats = {book_id: {field: value for field, value in delta['stats'].items() if value}
+		         for book_id, delta in self.books.items()}
+		stats = {book_id: changes for book_id, changes in stats.items() if changes}
+		if not stats:
+			return
+		fields = {field for changes in stats.values() for field in changes}
+		updated = BookStats.objects.filter(book_id__in=stats).update(**{
+			field: F(field) + self.shift(stats, field) for field in fields})
+		if updated < len(stats):
+			# первая связь книги: строку проще посчитать по связям целиком
+			missing = set(stats)
+			if updated:
+				missing -= set(BookStats.objects.filter(book_id__in=stats)
+				               .values_list('book_id', flat=True))
+			write_book_stats(UserBookRelation.objects.filter(book_id__in=missing))
+
+	@staticmethod
+	def shift(deltas, field):
+		"""CASE с приращением ``field`` для каждой книги."""
+		whens = [When(pk=book_id, then=Value(delta[field]))
+		         for book_id, delta in deltas.items() if delta.get(field)]
+		return Case(*whens, default=Value(0), output_field=IntegerField()) if whens else Value(0)
+
+
+def refresh_book_counters(books=None):
+	"""Пересчитывает счётчики и BookStats книг по таблице UserBookRelation."""
+	if books is None:
+		books = Book.objects.all()
+	relations = UserBookRelation.objects.filter(book=OuterRef('pk')).order_by()
+
+	def total(condition, aggregate):
+		# условия совпадают с частичными индексами store_ubr_book_liked_idx
+		# и store_ubr_book_rated_idx
+		values = relations.filter(condition).values('book').annotate(value=aggregate)
+		return Coalesce(Subquery(values.values('value'), output_field=IntegerField()), 0)
+
+	rated = Q(rate__isnull=False)
+	updated = books.update(likes_count=total(Q(like=True), Count('pk')),
+	                       rates_sum=total(rated, Sum('rate')),
+	                       rates_count=total(rated, Count('rate')),
+	                       updated_at=Now())
+	books.update(rating=rating_expression())
+	refresh_book_stats(books)
+	return updated
+
+
+def refresh_book_stats(books=None):
+	"""Пересчитывает BookStats книг одним GROUP BY по связям."""
+	relations = UserBookRelation.objects.all()
+	stats = BookStats.objects.all()
+	if books is not None:
+		relations = relations.filter(book__in=books)
+		stats = stats.filter(book__in=books)
+
+	write_book_stats(relations)
+	# у книг, потерявших все связи, статистика пустая
+	stats.filter(~Exists(UserBookRelation.objects.filter(book=OuterRef('book')))).delete()
+
+
+def write_book_stats(relations):
+	"""Записывает (INSERT ... ON CONFLICT DO UPDATE) BookStats книг из ``relations``."""
+	aggregates = {'likes': Count('pk', filter=Q(like=True)),
+	              'bookmarks': Count('pk', filter=Q(in_bookmarks=True))}
+	for rate, _ in UserBookRelation.RATE_CHOICES:
+		aggregates[BookStats.rate_field(rate)] = Count('pk', filter=Q(rate=rate))
+	rows = relations.order_by().values('book').annotate(**aggregates)
+
+	BookStats.objects.bulk_create(
+		[BookStats(book_id=row.pop('book'), **row) for row in rows],
+		update_conflicts=True, unique_fields=['book'],
+		update_fields=BookStats.COUNTER_FIELDS)
+
+
+def readers_preview(limit):
+	"""
+	Prefetch первых ``limit`` читателей каждой книги в book.readers_preview.
+
+	Все книги страницы обслуживает один запрос: коррелированный подзапрос
+	с LIMIT отбирает не больше ``limit`` связей на книгу.
+	"""
+	first_relations = UserBookRelation.objects.filter(
+		book=OuterRef('book')).order_by('id').values('id')[:limit]
+	relations = UserBookRelation.objects.filter(
+		id__in=Subquery(first_relations)).select_related('user').order_by('id')
+	return Prefetch('userbookrelation_set', queryset=relations,
+	                to_attr='readers_preview')
+
+
+def with_user_relation(books, user):
+	"""
+	Добавляет к книгам поля user_like, user_in_bookmarks и user_rate связи
+	пользователя ``user`` (None, если связи нет) одним LEFT JOIN.
+	"""
+	return books.annotate(
+		user_relation=FilteredRelation('userbookrelation',
+		                               condition=Q(userbookrelation__user=user)),
+		user_like=F('user_relation__like'),
+		user_in_bookmarks=F('user_relation__in_bookmarks'),
+		user_rate=F('user_relation__rate'),
+	)
+
+
+def readers_count():
+	"""Подзапрос с числом читателей книги."""
+	relations = UserBookRelation.objects.filter(
+		book=OuterRef('pk')).order_by().values('book')
+	return Coalesce(Subquery(relations.annotate(count=Count('pk')).values('count'),
+	                         output_field=IntegerField()), 0)
+
+
+def upsert_relations(user, items, deltas=None):
+	"""
+	Применяет к связям пользователя список изменений одним пакетом.
+
+	``items`` - словари с книгой в ключе 'book' и изменяемыми полями;
+	изменения одной книги сливаются по порядку (побеждает последнее).
+	Связи с одинаковым набором полей записываются одним
+	INSERT ... ON CONFLICT DO UPDATE, счётчики книг сдвигаются на разницу
+	со старыми значениями связей. Если передан ``deltas`` (BookDeltas),
+	изменения счётчиков только накапливаются в нём: вызывающий применяет
+	их один раз на несколько вызовов и сбрасывает кэш книг. Возвращает
+	множество id книг, для которых связь была создана. Вызывать внутри
+	transaction.atomic().
+	"""
+	changes = {}
+	for item in items:
+		fields = dict(item)
+		book = fields.pop('book')
+		changes.setdefault(book.pk, {}).update(fields)
+	if not changes:
+		return set()
+
+	# блокировка: параллельная запись тех же связей не собьёт разницу счётчиков
+	existing = {row['book_id']: row for row in UserBookRelation.objects.filter(
+		user=user, book_id__in=changes).select_for_update().values(*COUNTED_FIELDS)}
+
+	groups = {}
+	for book_id, fields in changes.items():
+		groups.setdefault(tuple(sorted(fields)), []).append(
+			UserBookRelation(user=user, book_id=book_id, **fields))
+	for update_fields, relations in groups.items():
+		if update_fields:
+			UserBookRelation.objects.bulk_create(
+				relations, update_conflicts=True, unique_fields=['user', 'book'],
+				update_fields=update_fields + ('updated_at',))
+		else:
+			UserBookRelation.objects.bulk_create(relations, ignore_conflicts=True)
+
+	own_deltas = deltas is None
+	if own_deltas:
+		deltas = BookDeltas()
+	for book_id, fields in changes.items():
+		old = existing.get(book_id)
+		deltas.add(old, dict(old or EMPTY_RELATION, book_id=book_id, **fields))
+	if own_deltas:
+		deltas.apply()
+		invalidate_books_on_commit(list(changes))
+	return set(changes) - set(existing)
@@ -0,0 +1,127 @@
+import json
+import random
+from contextlib import nullcontext
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from store.benchmark import (client_load, count_queries, http_load, rollback, seed_books,
+                             seed_relations, seed_users, unthrottled)
+from store.logic import refresh_book_counters
+from store.models import Book
+from store.throttling import RelationWriteThrottle
+
+
+class Command(BaseCommand):
+	help = ('Seeds synthetic books, users and relations and writes a JSON report with '
+	        'latency percentiles, throughput and query counts of the main endpoints')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--books', type=int, default=10000)
+		parser.add_argument('--users', type=int, default=1000)
+		parser.add_argument('--relations', type=int, default=50000)
+		parser.add_argument('--skew', type=float, default=1.1,
+		                    help='Zipf exponent of book popularity')
+		parser.add_argument('--requests', type=int, default=200,
+		                    help='requests per scenario')
+		parser.add_argument('--seed', type=int, default=0)
+		parser.add_argument('--response-cache', action='store_true',
+		                    help='keep the response cache on (off by default so requests hit the DB)')
+		parser.add_argument('--keep', action='store_true',
+		                    help='commit the seeded data instead of rolling it back')
+		parser.add_argument('--url', help='also load-test GET scenarios on a running server, '
+		                                  'e.g. http://127.0.0.1:8000 (needs --keep)')
+		parser.add_argument('--concurrency', type=int, default=20)
+		parser.add_argument('--output', help='report file, stdout by default')
+
+	def handle(self, *args, url, keep, output, **options):
+		if url and not keep:
+			raise CommandError('--url needs --keep: the server cannot see rolled back data')
+
+		# без отката данные остаются в БД для нагрузки по --url
+		with nullcontext() if keep else rollback():
+			book_ids, user_ids = self.seed(options)
+			scenarios = self.scenarios(book_ids)
+			report = {
+				'meta': {key: options[key] for key in (
+					'books', 'users', 'relations', 'skew', 'requests', 'seed', 'response_cache')},
+				'client': self.run_client(scenarios, book_ids, user_ids, options),
+			}
+		if url:
+			report['http'] = {
+				name: self.rounded(http_load(f'{url.rstrip("/")}{path}?{urlencode(params)}',
+				                             options['requests'], options['concurrency']))
+				for name, (path, params) in scenarios.items()}
+
+		content = json.dumps(report, indent=2, sort_keys=True)
+		if output:
+			with open(output, 'w') as file:
+				file.write(content + '\n')
+		else:
+			self.stdout.write(content)
+
+	def seed(self, options):
+		self.stderr.write(f'Seeding {options["books"]} books, {options["users"]} users, '
+		                  f'{options["relations"]} relations...')
+		first_id = (Book.objects.order_by('-pk').values_list('pk', flat=True).first() or 0) + 1
+		seed_books(options['books'], seed=options['seed'])
+		book_ids = list(Book.objects.filter(pk__gte=first_id).order_by('pk')
+		                .values_list('pk', flat=True))
+		user_ids = seed_users(options['users'])
+		seed_relations(book_ids, user_ids, options['relations'], skew=options['skew'],
+		               seed=options['seed'])
+		refresh_book_counters(Book.objects.filter(pk__gte=first_id))
+		return book_ids, user_ids
+
+	@staticmethod
+	def scenarios(book_ids):
+		"""GET-сценарии: путь и параметры. Первые книги - самые популярные."""
+		hot_book = Book.objects.only('price').get(pk=book_ids[0])
+		return {
+			'list': (reverse('book-list'), {'page_size': 20}),
+			'filter': (reverse('book-list'), {'price': hot_book.price, 'page_size': 20}),
+			'search': (reverse('book-list'), {'search': 'Book 1', 'page_size': 20}),
+			'ordering_rating': (reverse('book-list'), {'ordering': '-rating', 'page_size': 20}),
+			'detail': (reverse('book-detail', args=(hot_book.pk,)), {}),
+		}
+
+	def run_client(self, scenarios, book_ids, user_ids, options):
+		rnd = random.Random(options['seed'])
+		client = Client()
+		client.force_login(User.objects.get(pk=user_ids[0]))
+		hot_books = book_ids[:10]
+
+		def patch_relation():
+			url = reverse('userbookrelation-detail', args=(rnd.choice(hot_books),))
+			return client.patch(url, data={'like': rnd.random() < 0.5, 'rate': rnd.randint(1, 5)},
+			                    content_type='application/json')
+
+		requests = {name: (lambda path=path, params=params: client.get(path, params))
+		            for name, (path, params) in scenarios.items()}
+		requests['relation_patch'] = patch_relation
+
+		cache_settings = {} if options['response_cache'] else {
+			'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}}
+		results = {}
+		# 200 изменений связей подряд упираются в relation_write, а измерять
+		# нужно сам эндпоинт; ответы не 2xx не входят в перцентили (errors)
+		with override_settings(ALLOWED_HOSTS=['testserver'], **cache_settings), \
+				unthrottled(RelationWriteThrottle):
+			for name, request in requests.items():
+				# CaptureQueriesContext не подходит: журнал запросов
+				# сбрасывается по сигналу request_started
+				response, queries = count_queries(request)
+				if response.status_code >= 400:
+					raise CommandError(f'{name} returned {response.status_code}')
+				stats = client_load(request, options['requests'])
+				results[name] = self.rounded(dict(stats, queries=queries))
+				self.stderr.write(f'{name}: p50 {stats["p50"]:.2f} ms')
+		return results
+
+	@staticmethod
+	def rounded(stats):
+		return {key: round(value, 3) if isinstance(value, float) else value
+		        for key, value in stats.items()}
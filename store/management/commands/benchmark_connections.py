@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+
+from store.benchmark import percentiles
+
+
+class Command(BaseCommand):
+	help = ('Compares request latency with a new DB connection per request (CONN_MAX_AGE=0) '
+	        'and with persistent connections; run against a local PostgreSQL')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--url', default='/book/?page_size=20')
+		parser.add_argument('--requests', type=int, default=200)
+		parser.add_argument('--conn-max-age', type=int, default=60)
+		parser.add_argument('--database', default='default')
+
+	def handle(self, *args, url, requests, conn_max_age, database, **options):
+		self.stdout.write(f'{"mode":<12}{"p50":>10}{"p95":>10}{"p99":>10}{"connects":>10}')
+		for mode, max_age in (('per-request', 0), ('persistent', conn_max_age)):
+			stats = self.run(url, requests, database, max_age)
+			latency = ''.join(f'{stats[p]:>10.2f}' for p in ('p50', 'p95', 'p99'))
+			self.stdout.write(f'{mode:<12}{latency}{stats["connects"]:>10}')
+
+	@staticmethod
+	def run(url, requests, database, max_age):
+		connection = connections[database]
+		saved = {key: connection.settings_dict[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+		connection.close()
+		connection.settings_dict.update(CONN_MAX_AGE=max_age, CONN_HEALTH_CHECKS=max_age != 0)
+		connects = []
+
+		def count(sender, connection, **kwargs):
+			if connection.alias == database:
+				connects.append(1)
+
+		client, timings = Client(), []
+		# кэш ответов отключён, иначе запросы не доходят до БД
+		with override_settings(ALLOWED_HOSTS=['testserver'], CACHES={
+				'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+			connection_created.connect(count)
+			try:
+				for _ in range(requests):
+					start = time.perf_counter()
+					client.get(url)
+					# тестовый Client не закрывает соединения, как это делает
+					# обработчик запросов по сигналу request_finished
+					close_old_connections()
+					timings.append((time.perf_counter() - start) * 1000)
+			finally:
+				connection_created.disconnect(count)
+				connection.settings_dict.update(saved)
+		return {'connects': len(connects), **percentiles(timings)}
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+
+from store.benchmark import measure, rollback, seed_books
+from store.models import Book
+from store.pagination import BookCursorPagination
+
+
+class Command(BaseCommand):
+	help = 'Compares OFFSET and keyset (cursor) pagination of books at different depths'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--books', type=int, default=1000000)
+		parser.add_argument('--page-size', type=int, default=20)
+		parser.add_argument('--depths', default='0,1000,10000,100000,500000,990000')
+		parser.add_argument('--repeat', type=int, default=5)
+
+	def handle(self, *args, books, page_size, depths, repeat, **options):
+		depths = [int(depth) for depth in depths.split(',') if int(depth) < books]
+		paginator = BookCursorPagination()
+
+		# данные создаются внутри транзакции и откатываются после замеров
+		with rollback():
+			self.stdout.write(f'Seeding {books} books...')
+			seed_books(books)
+			self.stdout.write(f'{"ordering":<10}{"depth":>10}{"offset, ms":>14}{"keyset, ms":>14}')
+
+			for order in ('price', '-rating', 'author'):
+				ordering = paginator.get_ordering(Book.objects.order_by(order))
+				queryset = paginator.apply_ordering(Book.objects.all(), ordering)
+
+				for depth in depths:
+					def offset_page():
+						return list(queryset[depth:depth + page_size])
+
+					if depth:
+						previous = queryset[depth - 1]
+						values = paginator.get_values(previous, ordering)
+						keyset_queryset = paginator.filter_after(queryset, ordering, values)
+					else:
+						keyset_queryset = queryset
+
+					def keyset_page():
+						return list(keyset_queryset[:page_size])
+
+					assert offset_page() == keyset_page()
+					self.stdout.write(
+						f'{order:<10}{depth:>10}'
+						f'{measure(offset_page, repeat):>14.2f}'
+						f'{measure(keyset_page, repeat):>14.2f}')
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from store.benchmark import measure, rollback, seed_books, seed_readers, seed_users
+from store.models import Book
+from store.serializers import BooksFastSerializer, BooksSerializer
+from store.views import BookViewSet
+
+
+class Command(BaseCommand):
+	help = 'Compares BooksSerializer with BooksFastSerializer on the book list'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--books', type=int, default=10000)
+		parser.add_argument('--users', type=int, default=100)
+		parser.add_argument('--readers-per-book', type=int, default=3)
+		parser.add_argument('--repeat', type=int, default=3)
+
+	def handle(self, *args, books, users, readers_per_book, repeat, **options):
+		renderer = JSONRenderer()
+
+		def regular():
+			queryset = BookViewSet.queryset.order_by('id')
+			return renderer.render(BooksSerializer(queryset, many=True).data)
+
+		def fast():
+			queryset = Book.objects.order_by('id').values(*BooksFastSerializer.value_fields)
+			return renderer.render(BooksFastSerializer(queryset, many=True).data)
+
+		with rollback():
+			self.stdout.write(f'Seeding {books} books...')
+			seed_books(books)
+			seed_readers(list(Book.objects.values_list('pk', flat=True)),
+			             seed_users(users), readers_per_book)
+
+			if regular() != fast():
+				self.stderr.write('Rendered output differs')
+				return
+			regular_ms, fast_ms = measure(regular, repeat), measure(fast, repeat)
+
+		self.stdout.write(f'BooksSerializer:     {regular_ms:10.1f} ms')
+		self.stdout.write(f'BooksFastSerializer: {fast_ms:10.1f} ms')
+		self.stdout.write(f'Speedup:             {regular_ms / fast_ms:10.1f}x')
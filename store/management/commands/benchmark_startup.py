@@ -0,0 +1,58 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+# выполняется в отдельном интерпретаторе: время до готовности WSGI-приложения
+# (включая URLconf и вьюхи) и пиковая память процесса
+STARTUP_SCRIPT = '''
+import json, resource, sys, time
+start = time.perf_counter()
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+application = get_wsgi_application()
+get_resolver().url_patterns
+ready = time.perf_counter() - start
+from django.apps import apps
+print(json.dumps({
+    'ready_ms': ready * 1000,
+    'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'modules': len(sys.modules),
+    'apps': len(apps.get_app_configs()),
+}))
+'''
+
+
+class Command(BaseCommand):
+	help = ('Starts a fresh interpreter for each settings module and reports the time until '
+	        'the WSGI application is ready and the peak RSS (medians of --repeat runs)')
+
+	def add_arguments(self, parser):
+		parser.add_argument('settings_modules', nargs='*',
+		                    default=['books.settings', 'books.settings_api'])
+		parser.add_argument('--repeat', type=int, default=5)
+
+	def handle(self, *args, settings_modules, repeat, **options):
+		self.stdout.write(f'{"settings":<24}{"wall_ms":>10}{"ready_ms":>10}{"rss_mb":>10}'
+		                  f'{"modules":>10}{"apps":>6}')
+		for module in settings_modules:
+			runs = [self.run(module) for _ in range(repeat)]
+			stats = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+			self.stdout.write(f'{module:<24}{stats["wall_ms"]:>10.1f}{stats["ready_ms"]:>10.1f}'
+			                  f'{stats["rss_mb"]:>10.1f}{stats["modules"]:>10.0f}'
+			                  f'{stats["apps"]:>6.0f}')
+
+	@staticmethod
+	def run(module):
+		env = dict(os.environ, DJANGO_SETTINGS_MODULE=module)
+		start = time.perf_counter()
+		result = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], env=env,
+		                        capture_output=True, text=True)
+		wall = time.perf_counter() - start
+		if result.returncode:
+			raise CommandError(f'{module} failed to start:\n{result.stderr}')
+		return dict(json.loads(result.stdout.splitlines()[-1]), wall_ms=wall * 1000)
@@ -0,0 +1,36 @@
+import json
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from store.importers import IMPORT_FORMATS, import_books, read_rows
+
+
+class Command(BaseCommand):
+	help = 'Imports books from a CSV or JSON Lines file in batches'
+
+	def add_arguments(self, parser):
+		parser.add_argument('path')
+		parser.add_argument('--owner', required=True, help='username of the books owner')
+		parser.add_argument('--format', dest='file_format', choices=IMPORT_FORMATS,
+		                    help='file format, by default taken from the extension')
+		parser.add_argument('--batch-size', type=int, default=1000)
+
+	def handle(self, *args, path, owner, file_format, batch_size, **options):
+		try:
+			owner = User.objects.get(username=owner)
+		except User.DoesNotExist:
+			raise CommandError(f'User "{owner}" does not exist')
+
+		file_format = file_format or Path(path).suffix.lstrip('.').lower()
+		if file_format not in IMPORT_FORMATS:
+			raise CommandError(f'Unknown format "{file_format}", use --format')
+
+		with open(path, newline='', encoding='utf-8') as lines:
+			report = import_books(read_rows(lines, file_format), owner=owner,
+			                      batch_size=batch_size)
+
+		for error in report['errors']:
+			self.stderr.write(f'row {error["row"]}: {json.dumps(error["errors"], ensure_ascii=False)}')
+		self.stdout.write(f'Created {report["created"]} books, skipped {report["invalid"]} invalid rows')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from store.benchmark import http_load
+
+
+class Command(BaseCommand):
+	help = ('Load-tests running servers, e.g. WSGI /book/ against ASGI /async/book/: '
+	        'loadtest --url http://127.0.0.1:8000/book/ --url http://127.0.0.1:8001/async/book/')
+
+	def add_arguments(self, parser):
+		parser.add_argument('--url', action='append', required=True, dest='urls')
+		parser.add_argument('--requests', type=int, default=1000)
+		parser.add_argument('--concurrency', type=int, default=50)
+
+	def handle(self, *args, urls, requests, concurrency, **options):
+		self.stdout.write(f'{"url":<50}{"rps":>10}{"p50":>10}{"p95":>10}{"p99":>10}{"errors":>8}')
+		for url in urls:
+			stats = http_load(url, requests, concurrency)
+			latency = ''.join(f'{stats[p]:>10.1f}' if stats[p] is not None else f'{"-":>10}'
+			                  for p in ('p50', 'p95', 'p99'))
+			self.stdout.write(f'{url:<50}{stats["throughput"]:>10.1f}{latency}{stats["errors"]:>8}')
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.outbox import process_relation_outbox
+
+
+class Command(BaseCommand):
+	help = 'Applies queued relation changes (STORE_RELATION_WRITE_BEHIND) in coalesced batches'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=1000)
+		parser.add_argument('--interval', type=float, default=0,
+		                    help='poll the queue every N seconds instead of exiting when it is empty')
+
+	def handle(self, *args, batch_size, interval, **options):
+		total = 0
+		while True:
+			processed = process_relation_outbox(batch_size=batch_size)
+			total += processed
+			if processed:
+				continue
+			if not interval:
+				break
+			time.sleep(interval)
+		self.stdout.write(f'Applied {total} relation changes')
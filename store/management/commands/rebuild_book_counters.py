@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from store.cache import invalidate_all_books
+from store.logic import refresh_book_counters
+from store.models import Book
+
+
+class Command(BaseCommand):
+	help = 'Rebuilds likes_count / rating counters and BookStats of books from user relations'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=1000)
+
+	def handle(self, *args, batch_size, **options):
+		last_id, total = 0, 0
+		while True:
+			ids = list(Book.objects.filter(pk__gt=last_id).order_by('pk')
+			           .values_list('pk', flat=True)[:batch_size])
+			if not ids:
+				break
+			with transaction.atomic():
+				total += refresh_book_counters(Book.objects.filter(pk__in=ids))
+			# счётчики меняются UPDATE в обход сигналов, а пакеты покрывают весь каталог
+			invalidate_all_books()
+			last_id = ids[-1]
+		self.stdout.write(f'Rebuilt counters for {total} books')
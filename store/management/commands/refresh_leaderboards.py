@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from store.leaderboards import BOARDS, LEADERBOARD_SIZE, refresh_leaderboards
+
+
+class Command(BaseCommand):
+	help = 'Recomputes book leaderboards (run periodically, e.g. from cron)'
+
+	def add_arguments(self, parser):
+		parser.add_argument('--board', dest='boards', action='append', choices=list(BOARDS),
+		                    help='board to refresh, may be repeated; all by default')
+		parser.add_argument('--size', type=int, default=LEADERBOARD_SIZE)
+
+	def handle(self, *args, boards, size, **options):
+		for board, count in refresh_leaderboards(boards, size=size).items():
+			self.stdout.write(f'{board}: {count} books')
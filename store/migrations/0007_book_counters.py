@@ -0,0 +1,56 @@
+# Generated by Django 4.1.4 on 2026-10-17 21:54
+
+from django.db import migrations, models
+from django.db.models import (Case, Count, DecimalField, F, FloatField,
+                              IntegerField, OuterRef, Q, Subquery, Sum, When)
+from django.db.models.functions import Cast, Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Book = apps.get_model('store', 'Book')
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    relations = UserBookRelation.objects.filter(
+        book=OuterRef('pk')).order_by().values('book')
+
+    def total(aggregate):
+        return Coalesce(Subquery(relations.annotate(value=aggregate).values('value'),
+                                 output_field=IntegerField()), 0)
+
+    Book.objects.update(likes_count=total(Count('pk', filter=Q(like=True))),
+                        rates_sum=total(Sum('rate')),
+                        rates_count=total(Count('rate')))
+    Book.objects.update(rating=Case(
+        When(rates_count=0, then=None),
+        default=Cast('rates_sum', FloatField()) / F('rates_count'),
+        output_field=DecimalField(max_digits=3, decimal_places=2)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_alter_userbookrelation_rate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='likes_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rates_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rates_sum',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=3, null=True),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
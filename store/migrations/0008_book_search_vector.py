@@ -0,0 +1,61 @@
+# Generated by Django 4.1.4 on 2026-10-17 21:56
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+SEARCH_SQL = """
+CREATE FUNCTION store_book_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(NEW.author, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_book_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, author ON store_book
+    FOR EACH ROW EXECUTE FUNCTION store_book_search_vector_update();
+
+UPDATE store_book SET name = name;
+
+CREATE INDEX store_book_search_vector_gin ON store_book USING gin (search_vector);
+CREATE INDEX store_book_name_trgm ON store_book USING gin (name gin_trgm_ops);
+CREATE INDEX store_book_author_trgm ON store_book USING gin (author gin_trgm_ops);
+"""
+
+DROP_SEARCH_SQL = """
+DROP INDEX IF EXISTS store_book_author_trgm;
+DROP INDEX IF EXISTS store_book_name_trgm;
+DROP INDEX IF EXISTS store_book_search_vector_gin;
+DROP TRIGGER IF EXISTS store_book_search_vector_trigger ON store_book;
+DROP FUNCTION IF EXISTS store_book_search_vector_update();
+"""
+
+
+def run_on_postgresql(sql):
+    def operation(apps, schema_editor):
+        # триггер и GIN-индексы есть только в PostgreSQL
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_book_counters'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='book',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(run_on_postgresql(SEARCH_SQL),
+                             run_on_postgresql(DROP_SEARCH_SQL)),
+    ]
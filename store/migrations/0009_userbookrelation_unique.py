@@ -0,0 +1,34 @@
+# Generated by Django 4.1.4 on 2026-10-17 21:58
+
+from importlib import import_module
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicates(apps, schema_editor):
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    duplicates = UserBookRelation.objects.values('user', 'book').order_by() \
+        .annotate(last_id=Max('id'), total=Count('id')).filter(total__gt=1)
+    if not duplicates:
+        return
+    # остаётся последняя связь пары, после чего счётчики книг пересчитываются
+    for pair in duplicates:
+        UserBookRelation.objects.filter(user=pair['user'], book=pair['book']) \
+            .exclude(id=pair['last_id']).delete()
+    import_module('store.migrations.0007_book_counters').fill_counters(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userbookrelation',
+            constraint=models.UniqueConstraint(fields=('user', 'book'), name='store_userbookrelation_user_book_uniq'),
+        ),
+    ]
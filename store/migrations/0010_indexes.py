@@ -0,0 +1,42 @@
+# Generated by Django 4.1.4 on 2026-10-17 22:04
+
+from django.db import migrations, models
+
+
+def create_rating_index(apps, schema_editor):
+    # keyset-пагинация сортирует NULL первыми; в SQLite это порядок
+    # по умолчанию, а SQLite не поддерживает NULLS FIRST в индексах
+    nulls_first = ' NULLS FIRST' if schema_editor.connection.vendor == 'postgresql' else ''
+    schema_editor.execute(
+        f'CREATE INDEX store_book_rating_id_idx ON store_book (rating ASC{nulls_first}, id)')
+
+
+def drop_rating_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX store_book_rating_id_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_userbookrelation_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['author', 'id'], name='store_book_author_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('like', True)), fields=['book'], name='store_ubr_book_liked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(condition=models.Q(('rate__isnull', False)), fields=['book', 'rate'], name='store_ubr_book_rated_idx'),
+        ),
+        migrations.RunPython(create_rating_index, drop_rating_index),
+    ]
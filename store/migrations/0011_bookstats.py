@@ -0,0 +1,42 @@
+# Generated by Django 4.1.4 on 2026-10-17 22:07
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def fill_stats(apps, schema_editor):
+    UserBookRelation = apps.get_model('store', 'UserBookRelation')
+    BookStats = apps.get_model('store', 'BookStats')
+    aggregates = {'likes': Count('pk', filter=Q(like=True)),
+                  'bookmarks': Count('pk', filter=Q(in_bookmarks=True))}
+    for rate in range(1, 6):
+        aggregates[f'rate_{rate}'] = Count('pk', filter=Q(rate=rate))
+    rows = UserBookRelation.objects.order_by().values('book').annotate(**aggregates)
+    BookStats.objects.bulk_create(
+        (BookStats(book_id=row.pop('book'), **row) for row in rows.iterator()),
+        batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookStats',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='store.book')),
+                ('likes', models.PositiveIntegerField(default=0)),
+                ('bookmarks', models.PositiveIntegerField(default=0)),
+                ('rate_1', models.PositiveIntegerField(default=0)),
+                ('rate_2', models.PositiveIntegerField(default=0)),
+                ('rate_3', models.PositiveIntegerField(default=0)),
+                ('rate_4', models.PositiveIntegerField(default=0)),
+                ('rate_5', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
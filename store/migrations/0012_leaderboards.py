@@ -0,0 +1,41 @@
+# Generated by Django 4.1.4 on 2026-10-17 22:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_bookstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('board', models.CharField(choices=[('liked', 'Most liked'), ('rated', 'Highest rated'), ('bookmarked', 'Most bookmarked'), ('trending', 'Trending')], max_length=16)),
+                ('position', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='userbookrelation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='userbookrelation',
+            index=models.Index(fields=['updated_at'], name='store_ubr_updated_at_idx'),
+        ),
+        migrations.AddField(
+            model_name='bookrank',
+            name='book',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ranks', to='store.book'),
+        ),
+        migrations.AddConstraint(
+            model_name='bookrank',
+            constraint=models.UniqueConstraint(fields=('board', 'position'), name='store_bookrank_board_position_uniq'),
+        ),
+    ]
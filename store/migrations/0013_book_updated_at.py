@@ -0,0 +1,28 @@
+# Generated by Django 4.1.4 on 2026-10-17 22:12
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+
+def restore_rating_index(apps, schema_editor):
+    # SQLite пересоздаёт таблицу при AddField и теряет индекс из 0010,
+    # которого нет в состоянии моделей
+    if schema_editor.connection.vendor == 'sqlite':
+        import_module('store.migrations.0010_indexes').create_rating_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_leaderboards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(restore_rating_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.1.4 on 2026-10-17 23:00
+
+from importlib import import_module
+
+from django.db import migrations, models
+import store.models
+
+
+def drop_raw_rating_index(apps, schema_editor):
+    # индекс из 0010 создан SQL-запросом вне состояния моделей; теперь он
+    # объявлен в Book.Meta.indexes и переживает пересоздание таблицы в SQLite
+    schema_editor.execute('DROP INDEX IF EXISTS store_book_rating_id_idx')
+
+
+def create_raw_rating_index(apps, schema_editor):
+    import_module('store.migrations.0010_indexes').create_rating_index(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_relationoutbox'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_raw_rating_index, create_raw_rating_index),
+        migrations.AddIndex(
+            model_name='book',
+            index=store.models.NullsOrderIndex(models.OrderBy(models.F('rating'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='store_book_rating_id_idx'),
+        ),
+    ]
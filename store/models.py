@@ -1,8 +1,32 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import F, OrderBy
+
+
+class NullsOrderIndex(models.Index):
+	"""
+	Индекс по выражениям с NULLS FIRST/LAST. SQLite не принимает их в
+	CREATE INDEX; у него NULL и так наименьшее значение, поэтому для
+	asc(nulls_first=True) и desc(nulls_last=True) модификатор опускается.
+	"""
+
+	def create_sql(self, model, schema_editor, using='', **kwargs):
+		index = self
+		if schema_editor.connection.vendor == 'sqlite':
+			index = self.clone()
+			index.expressions = tuple(
+				OrderBy(expression.expression, descending=expression.descending)
+				if isinstance(expression, OrderBy) else expression
+				for expression in self.expressions)
+		return models.Index.create_sql(index, model, schema_editor, using=using, **kwargs)
 
 
 class Book(models.Model):
+	# меняются только через store.logic (F-выражения и пересчёт), обычный
+	# save() их не записывает, чтобы не затереть параллельные изменения
+	COUNTER_FIELDS = ('likes_count', 'rates_sum', 'rates_count', 'rating')
+
 	name = models.CharField(max_length=255)
 	price = models.DecimalField(max_digits=7, decimal_places=2)
 	author = models.CharField(max_length=255)
@@ -11,9 +35,46 @@ class Book(models.Model):
 	readers = models.ManyToManyField(User, through='UserBookRelation',
 	                                related_name='books')
 
+	# Денормализованные счётчики, поддерживаются store.logic
+	likes_count = models.PositiveIntegerField(default=0, editable=False)
+	rates_sum = models.PositiveIntegerField(default=0, editable=False)
+	rates_count = models.PositiveIntegerField(default=0, editable=False)
+	rating = models.DecimalField(max_digits=3, decimal_places=2, null=True,
+	                             editable=False)
+	# меняется и при изменении связей книги (store.logic), отдаётся в Last-Modified
+	updated_at = models.DateTimeField(auto_now=True)
+
+	# tsvector по name и author, на PostgreSQL заполняется триггером
+	search_vector = SearchVectorField(null=True, editable=False)
+
+	class Meta:
+		# составные индексы с id обслуживают keyset-пагинацию (store.pagination),
+		# rating - с тем же порядком NULL, что и у её сортировки
+		indexes = [
+			models.Index(fields=['price', 'id'], name='store_book_price_id_idx'),
+			models.Index(fields=['author', 'id'], name='store_book_author_id_idx'),
+			NullsOrderIndex(F('rating').desc(nulls_last=True), F('id').desc(),
+			                name='store_book_rating_id_idx'),
+		]
+
 	def __str__(self):
 		return f'{self.id}: {self.name}, {self.author}, price: {self.price}'
 
+	def save(self, *args, **kwargs):
+		if self.pk is not None and not self._state.adding and kwargs.get('update_fields') is None:
+			skipped = {*self.COUNTER_FIELDS, 'search_vector', *self.get_deferred_fields()}
+			kwargs['update_fields'] = [field.attname for field in self._meta.concrete_fields
+			                           if not field.primary_key and field.attname not in skipped]
+		super().save(*args, **kwargs)
+
+	@property
+	def current_stats(self):
+		"""BookStats книги; у книги без связей строки статистики нет."""
+		try:
+			return self.stats
+		except BookStats.DoesNotExist:
+			return BookStats(book_id=self.pk)
+
 
 class UserBookRelation(models.Model):
 	RATE_CHOICES = (
@@ -29,6 +90,115 @@ class UserBookRelation(models.Model):
 	like = models.BooleanField(default=False)
 	in_bookmarks = models.BooleanField(default=False)
 	rate = models.PositiveSmallIntegerField(choices=RATE_CHOICES, null=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['user', 'book'],
+			                        name='store_userbookrelation_user_book_uniq'),
+		]
+		# частичные индексы для подсчёта лайков и оценок книги
+		indexes = [
+			models.Index(fields=['book'], condition=models.Q(like=True),
+			             name='store_ubr_book_liked_idx'),
+			models.Index(fields=['book', 'rate'], condition=models.Q(rate__isnull=False),
+			             name='store_ubr_book_rated_idx'),
+			# окно trending-рейтинга (store.leaderboards)
+			models.Index(fields=['updated_at'], name='store_ubr_updated_at_idx'),
+		]
 
 	def __str__(self):
 		return f'{self.user.username}: {self.book.name}, RATE: {self.rate}'
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super().from_db(db, field_names, values)
+		# значения из БД нужны, чтобы посчитать изменение счётчиков книги
+		instance._loaded_values = dict(zip(field_names, values))
+		return instance
+
+	def save(self, *args, **kwargs):
+		from store.logic import apply_relation_change
+
+		old = getattr(self, '_loaded_values', None)
+		with transaction.atomic():
+			super().save(*args, **kwargs)
+			apply_relation_change(old, self._counted_values())
+		self._loaded_values = self._counted_values()
+
+	def _counted_values(self):
+		return {'book_id': self.book_id, 'like': self.like,
+		        'in_bookmarks': self.in_bookmarks, 'rate': self.rate}
+
+
+class BookStats(models.Model):
+	"""
+	Статистика связей книги: распределение оценок, лайки и закладки.
+	Поддерживается инкрементально store.logic, строка появляется
+	с первой связью книги.
+	"""
+	book = models.OneToOneField(Book, on_delete=models.CASCADE, primary_key=True,
+	                            related_name='stats')
+	likes = models.PositiveIntegerField(default=0)
+	bookmarks = models.PositiveIntegerField(default=0)
+	rate_1 = models.PositiveIntegerField(default=0)
+	rate_2 = models.PositiveIntegerField(default=0)
+	rate_3 = models.PositiveIntegerField(default=0)
+	rate_4 = models.PositiveIntegerField(default=0)
+	rate_5 = models.PositiveIntegerField(default=0)
+
+	COUNTER_FIELDS = ('likes', 'bookmarks', 'rate_1', 'rate_2', 'rate_3', 'rate_4', 'rate_5')
+
+	def __str__(self):
+		return f'{self.book_id}: likes: {self.likes}, bookmarks: {self.bookmarks}'
+
+	@staticmethod
+	def rate_field(rate):
+		return f'rate_{rate}'
+
+	@property
+	def rates(self):
+		return {rate: getattr(self, self.rate_field(rate))
+		        for rate, _ in UserBookRelation.RATE_CHOICES}
+
+
+class BookRank(models.Model):
+	"""Позиция книги в рейтинге, пересчитывается store.leaderboards."""
+	LIKED = 'liked'
+	RATED = 'rated'
+	BOOKMARKED = 'bookmarked'
+	TRENDING = 'trending'
+	BOARD_CHOICES = (
+		(LIKED, 'Most liked'),
+		(RATED, 'Highest rated'),
+		(BOOKMARKED, 'Most bookmarked'),
+		(TRENDING, 'Trending'),
+	)
+
+	board = models.CharField(max_length=16, choices=BOARD_CHOICES)
+	position = models.PositiveIntegerField()
+	book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='ranks')
+	score = models.FloatField()
+
+	class Meta:
+		constraints = [
+			models.UniqueConstraint(fields=['board', 'position'],
+			                        name='store_bookrank_board_position_uniq'),
+		]
+
+	def __str__(self):
+		return f'{self.board} #{self.position}: {self.book_id}'
+
+
+class RelationOutbox(models.Model):
+	"""
+	Отложенное изменение связи пользователь-книга (STORE_RELATION_WRITE_BEHIND),
+	применяется store.outbox.process_relation_outbox.
+	"""
+	user = models.ForeignKey(User, on_delete=models.CASCADE)
+	book = models.ForeignKey(Book, on_delete=models.CASCADE)
+	changes = models.JSONField()
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return f'{self.user_id}: {self.book_id}, {self.changes}'
@@ -0,0 +1,62 @@
+"""
+Отложенная запись связей пользователь-книга.
+
+При STORE_RELATION_WRITE_BEHIND изменение связи только добавляется
+в RelationOutbox, а process_relation_outbox (команда
+process_relation_outbox) применяет накопленные изменения пачками:
+изменения одной связи сливаются, побеждает последнее. Перед чтением
+собственных связей пользователя и перед его синхронными записями
+очередь этого пользователя применяется (flush_user_relations), так что
+пользователь всегда видит свои изменения.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from store.cache import invalidate_books_on_commit
+from store.logic import BookDeltas, upsert_relations
+from store.models import Book, RelationOutbox
+
+
+def write_behind_enabled():
+	return settings.STORE_RELATION_WRITE_BEHIND
+
+
+def enqueue_relation_change(user, book_id, changes):
+	RelationOutbox.objects.create(user=user, book_id=book_id, changes=changes)
+
+
+def process_relation_outbox(batch_size=1000, user=None):
+	"""
+	Применяет до ``batch_size`` изменений из очереди (все изменения ``user``,
+	если он передан) и возвращает их число.
+	"""
+	with transaction.atomic():
+		entries = RelationOutbox.objects.order_by('id')
+		if user is None:
+			# параллельный flush_user_relations не ждёт обработчик очереди
+			entries = list(entries.select_for_update(skip_locked=True)[:batch_size])
+		else:
+			entries = list(entries.filter(user=user).select_for_update())
+		if not entries:
+			return 0
+
+		items = {}
+		for entry in entries:
+			items.setdefault(entry.user_id, []).append(
+				dict(entry.changes, book=Book(pk=entry.book_id)))
+		# счётчики популярной книги сдвигаются один раз на всю пачку,
+		# а не по разу на каждого пользователя
+		deltas = BookDeltas()
+		for user_id, user_items in items.items():
+			upsert_relations(User(pk=user_id), user_items, deltas)
+		deltas.apply()
+		invalidate_books_on_commit(list(deltas.books))
+		RelationOutbox.objects.filter(pk__in=[entry.pk for entry in entries]).delete()
+	return len(entries)
+
+
+def flush_user_relations(user):
+	"""Применяет отложенные изменения связей пользователя перед чтением или записью."""
+	if write_behind_enabled() and user.is_authenticated:
+		process_relation_outbox(user=user)
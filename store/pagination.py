@@ -0,0 +1,235 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, CursorPagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class BookCursorPagination(BasePagination):
+	"""
+	Keyset-пагинация: следующая страница выбирается условием
+	WHERE (поля сортировки, id) > (значения последней строки), а не OFFSET,
+	поэтому стоимость страницы не зависит от глубины прокрутки.
+
+	Сортировка берётся из queryset (её выставляет OrderingFilter), id
+	добавляется как tie-breaker. NULL считается наименьшим значением,
+	так что при сортировке по убыванию книги без рейтинга идут последними.
+	Пагинация включается, только если клиент передал page_size или cursor.
+	"""
+	cursor_query_param = 'cursor'
+	page_size_query_param = 'page_size'
+	default_page_size = 20
+	max_page_size = 100
+	tie_breaker = 'id'
+	invalid_cursor_message = 'Invalid cursor'
+
+	def paginate_queryset(self, queryset, request, view=None):
+		self.page_size = self.get_page_size(request)
+		if self.page_size is None:
+			return None
+
+		self.base_url = request.build_absolute_uri()
+		self.ordering = self.get_ordering(queryset)
+		cursor = self.decode_cursor(request, queryset.model)
+		reverse = bool(cursor and cursor['r'])
+
+		ordering = self.reversed_ordering() if reverse else self.ordering
+		queryset = self.apply_ordering(queryset, ordering)
+		if cursor is not None:
+			queryset = self.filter_after(queryset, ordering, cursor['v'])
+
+		results = list(queryset[:self.page_size + 1])
+		has_more = len(results) > self.page_size
+		results = results[:self.page_size]
+		if reverse:
+			results.reverse()
+			self.has_next, self.has_previous = True, has_more
+		else:
+			self.has_next, self.has_previous = has_more, cursor is not None
+		self.page = results
+		return results
+
+	def get_page_size(self, request):
+		params = request.query_params
+		if self.page_size_query_param in params:
+			try:
+				return _positive_int(params[self.page_size_query_param],
+				                     strict=True, cutoff=self.max_page_size)
+			except (KeyError, ValueError):
+				pass
+		if self.cursor_query_param in params or self.page_size_query_param in params:
+			return self.default_page_size
+		return None
+
+	def get_ordering(self, queryset):
+		"""Сортировка queryset в виде [(поле, по убыванию), ...] с tie-breaker в конце."""
+		ordering = []
+		for field in queryset.query.order_by:
+			if not isinstance(field, str):
+				continue
+			name = field.lstrip('-')
+			if name in ('pk', self.tie_breaker):
+				break
+			ordering.append((name, field.startswith('-')))
+		# tie-breaker идёт в ту же сторону, что и последнее поле сортировки,
+		# чтобы страницу можно было прочитать одним проходом по индексу (поле, id)
+		ordering.append((self.tie_breaker, ordering[-1][1] if ordering else False))
+		return ordering
+
+	def reversed_ordering(self):
+		return [(name, not descending) for name, descending in self.ordering]
+
+	@classmethod
+	def apply_ordering(cls, queryset, ordering):
+		# NULLS FIRST/LAST только для nullable-полей: у остальных явный
+		# порядок NULL не совпал бы с обычными индексами (поле, id), и
+		# PostgreSQL сортировал бы выборку вместо чтения индекса
+		return queryset.order_by(*(
+			cls.order_expression(queryset.model, name, descending) for name, descending in ordering))
+
+	@staticmethod
+	def is_nullable(model, name):
+		try:
+			return model._meta.get_field(name).null
+		except FieldDoesNotExist:
+			return True
+
+	@classmethod
+	def order_expression(cls, model, name, descending):
+		if not cls.is_nullable(model, name):
+			return F(name).desc() if descending else F(name).asc()
+		return F(name).desc(nulls_last=True) if descending else F(name).asc(nulls_first=True)
+
+	@classmethod
+	def filter_after(cls, queryset, ordering, values):
+		"""Оставляет строки, идущие после строки со значениями ``values``."""
+		# IS NULL только для nullable-полей: лишний OR мешает PostgreSQL
+		# прочитать страницу одним диапазоном индекса
+		nullable = {name: cls.is_nullable(queryset.model, name) for name, _ in ordering}
+		condition = Q(pk__in=[])
+		equal = Q()
+		for (name, descending), value in zip(ordering, values):
+			if value is None:
+				after = Q(pk__in=[]) if descending else Q(**{f'{name}__isnull': False})
+				same = Q(**{f'{name}__isnull': True})
+			elif descending:
+				after = Q(**{f'{name}__lt': value})
+				if nullable[name]:
+					after |= Q(**{f'{name}__isnull': True})
+				same = Q(**{name: value})
+			else:
+				after = Q(**{f'{name}__gt': value})
+				same = Q(**{name: value})
+			condition |= equal & after
+			equal &= same
+
+		# явная граница по первому полю даёт СУБД условие для индекса:
+		# из одного OR она её не выводит и читала бы индекс с начала
+		(name, descending), value = ordering[0], values[0]
+		if value is not None:
+			bound = Q(**{f'{name}__lte': value}) if descending else Q(**{f'{name}__gte': value})
+			if descending and nullable[name]:
+				bound |= Q(**{f'{name}__isnull': True})
+			condition &= bound
+		return queryset.filter(condition)
+
+	def get_values(self, instance, ordering):
+		# BooksFastSerializer пагинирует строки .values(), а не объекты
+		if isinstance(instance, dict):
+			return [self.encode_value(instance[name]) for name, _ in ordering]
+		return [self.encode_value(getattr(instance, name)) for name, _ in ordering]
+
+	@staticmethod
+	def encode_value(value):
+		return str(value) if isinstance(value, Decimal) else value
+
+	def encode_cursor(self, instance, reverse):
+		cursor = {
+			'o': [[name, descending] for name, descending in self.ordering],
+			'v': self.get_values(instance, self.ordering),
+			'r': reverse,
+		}
+		encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode('ascii')
+		return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+	def decode_cursor(self, request, model):
+		encoded = request.query_params.get(self.cursor_query_param)
+		if encoded is None:
+			return None
+		try:
+			cursor = json.loads(urlsafe_b64decode(encoded.encode('ascii')))
+			ordering = [(name, descending) for name, descending in cursor['o']]
+			values = list(cursor['v'])
+			reverse = bool(cursor['r'])
+		except (TypeError, ValueError, KeyError):
+			raise NotFound(self.invalid_cursor_message)
+		# курсор, выданный для другой сортировки, даст неверную выборку
+		if ordering != self.ordering or len(values) != len(ordering):
+			raise NotFound(self.invalid_cursor_message)
+		values = [self.decode_value(model, name, value)
+		          for (name, _), value in zip(ordering, values)]
+		return {'v': values, 'r': reverse}
+
+	def decode_value(self, model, name, value):
+		"""Значение поля из курсора; подделанное значение не должно дойти до ORM."""
+		if value is not None and not isinstance(value, (str, int, float)) \
+				or isinstance(value, bool):
+			raise NotFound(self.invalid_cursor_message)
+		try:
+			field = model._meta.get_field(name)
+		except FieldDoesNotExist:
+			return value
+		if value is None:
+			if not field.null:
+				raise NotFound(self.invalid_cursor_message)
+			return None
+		try:
+			value = field.to_python(value)
+		except ValidationError:
+			raise NotFound(self.invalid_cursor_message)
+		if isinstance(value, Decimal) and not value.is_finite():
+			raise NotFound(self.invalid_cursor_message)
+		return value
+
+	def get_next_link(self):
+		if not self.has_next or not self.page:
+			return None
+		return self.encode_cursor(self.page[-1], reverse=False)
+
+	def get_previous_link(self):
+		if not self.has_previous or not self.page:
+			return None
+		return self.encode_cursor(self.page[0], reverse=True)
+
+	def get_paginated_response(self, data):
+		return Response(OrderedDict([
+			('next', self.get_next_link()),
+			('previous', self.get_previous_link()),
+			('results', data),
+		]))
+
+
+class ReadersCursorPagination(CursorPagination):
+	"""Читатели книги в порядке появления связи."""
+	ordering = 'id'
+	page_size = 50
+	page_size_query_param = 'page_size'
+	max_page_size = 500
+
+	def get_ordering(self, request, queryset, view):
+		# OrderingFilter вьюхи относится к книгам, а не к читателям
+		return (self.ordering,)
+
+
+class LibraryCursorPagination(CursorPagination):
+	"""Связи пользователя, последние первыми."""
+	ordering = '-id'
+	page_size = 50
+	page_size_query_param = 'page_size'
+	max_page_size = 500
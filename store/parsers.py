@@ -0,0 +1,28 @@
+import codecs
+
+from django.conf import settings
+from rest_framework.parsers import BaseParser
+
+from store.importers import read_rows
+
+
+class StreamParser(BaseParser):
+	"""
+	Не читает тело запроса целиком: request.data - генератор строк
+	для store.importers.import_books.
+	"""
+	file_format = None
+
+	def parse(self, stream, media_type=None, parser_context=None):
+		encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+		return read_rows(codecs.iterdecode(stream, encoding), self.file_format)
+
+
+class CSVStreamParser(StreamParser):
+	media_type = 'text/csv'
+	file_format = 'csv'
+
+
+class JSONLinesStreamParser(StreamParser):
+	media_type = 'application/x-ndjson'
+	file_format = 'jsonl'
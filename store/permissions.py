@@ -11,5 +11,6 @@ class IsOwnerOrStaffOrReadOnly(BasePermission):
             request.method in SAFE_METHODS or
             request.user and
             request.user.is_authenticated and
-            (obj.owner == request.user or request.user.is_staff)
+            # owner_id, а не owner: без запроса за владельцем
+            (obj.owner_id == request.user.pk or request.user.is_staff)
         )
\ No newline at end of file
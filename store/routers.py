@@ -0,0 +1,159 @@
+"""
+Чтение с реплик.
+
+ReplicaRoutingMiddleware отмечает запросы безопасными методами (GET, HEAD,
+OPTIONS), и ReplicaRouter направляет их чтения на одну из реплик
+settings.DATABASE_REPLICAS. Запросы, изменяющие данные, и чтения внутри
+транзакции идут в основную БД. Пользователь, который только что что-то
+изменил, STORE_READ_YOUR_WRITES_SECONDS читает из основной БД
+(ReadYourWritesMixin), чтобы увидеть свои изменения, даже если реплика
+отстаёт.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READ_YOUR_WRITES_KEY = 'store:user:{}:recent-write'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# состояние текущего запроса; None вне HTTP-запроса (команды, shell)
+request_routing = ContextVar('store_request_routing', default=None)
+
+
+class RequestRouting:
+	def __init__(self, request):
+		self.primary = request.method not in SAFE_METHODS
+		# пользователь запроса недавно что-то менял (route_user)
+		self.recent_write = False
+
+
+def route_user(user):
+	"""
+	Отправляет оставшиеся чтения запроса в основную БД, если ``user``
+	недавно что-то менял. Вызывается после аутентификации (ReadYourWritesMixin),
+	запросы самой аутентификации идут на реплику.
+	"""
+	routing = request_routing.get()
+	if routing is not None and not routing.primary and user.is_authenticated:
+		routing.primary = routing.recent_write = recently_wrote(user)
+
+
+def in_recent_write():
+	"""Запрос недавно писавшего пользователя: его чтения идут в основную БД."""
+	routing = request_routing.get()
+	return routing is not None and routing.recent_write
+
+
+def read_database():
+	"""Алиас БД, из которой сейчас читает ReplicaRouter."""
+	replicas = settings.DATABASE_REPLICAS
+	if not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+		return DEFAULT_DB_ALIAS
+	routing = request_routing.get()
+	if routing is None or routing.primary:
+		return DEFAULT_DB_ALIAS
+	return random.choice(replicas)
+
+
+def recently_wrote(user):
+	return cache.get(READ_YOUR_WRITES_KEY.format(user.pk)) is not None
+
+
+def mark_recent_write(user):
+	cache.set(READ_YOUR_WRITES_KEY.format(user.pk), True,
+	          settings.STORE_READ_YOUR_WRITES_SECONDS)
+
+
+class ReplicaRouter:
+	def db_for_read(self, model, **hints):
+		return read_database()
+
+	def db_for_write(self, model, **hints):
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# реплики содержат те же данные, что и основная БД
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		return db == DEFAULT_DB_ALIAS
+
+
+class ReadYourWritesMixin:
+	"""Для DRF-вьюх: чтения недавно писавшего пользователя идут в основную БД."""
+
+	def initial(self, request, *args, **kwargs):
+		route_user(request.user)
+		super().initial(request, *args, **kwargs)
+
+
+class ReplicaRoutingMiddleware:
+	"""
+	Выставляет request_routing на время запроса, включая отдачу тела
+	StreamingHttpResponse (?stream=true, экспорт): такие ответы читают
+	книги уже после выхода из вьюхи и тоже должны идти на реплику.
+	"""
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		routing = RequestRouting(request)
+		token = request_routing.set(routing)
+		try:
+			response = self.get_response(request)
+		finally:
+			request_routing.reset(token)
+		self.finish(request, response, routing)
+		return response
+
+	async def __acall__(self, request):
+		routing = RequestRouting(request)
+		token = request_routing.set(routing)
+		try:
+			response = await self.get_response(request)
+		finally:
+			request_routing.reset(token)
+		if routing.primary:
+			# request.user ленивый и может обратиться к БД
+			await sync_to_async(self.finish)(request, response, routing)
+		else:
+			self.finish(request, response, routing)
+		return response
+
+	@staticmethod
+	def finish(request, response, routing):
+		if response.streaming:
+			response.streaming_content = iterate_routed(response.streaming_content, routing)
+		user = getattr(request, 'user', None)
+		if request.method not in SAFE_METHODS and response.status_code < 400 \
+				and user is not None and user.is_authenticated:
+			mark_recent_write(user)
+
+
+def iterate_routed(content, routing):
+	"""
+	Итерирует ``content`` с выставленным request_routing. Переменная
+	выставляется на каждый шаг, а не на весь генератор: сервер может
+	читать тело из другого контекста, чем тот, где был создан ответ.
+	"""
+	iterator = iter(content)
+	while True:
+		token = request_routing.set(routing)
+		try:
+			chunk = next(iterator)
+		except StopIteration:
+			return
+		finally:
+			request_routing.reset(token)
+		yield chunk
@@ -1,8 +1,9 @@
 from django.contrib.auth.models import User
+from django.db.models import F
 from rest_framework import serializers
 from rest_framework.serializers import ModelSerializer
 
-from store.models import Book, UserBookRelation
+from store.models import Book, BookRank, BookStats, UserBookRelation
 
 
 class BookReadersSerializer(ModelSerializer):
@@ -11,20 +12,208 @@ class BookReadersSerializer(ModelSerializer):
 		model = User
 		fields = ('first_name', 'last_name')
 
+class BookStatsSerializer(ModelSerializer):
+	rates = serializers.SerializerMethodField()
+
+	class Meta:
+		model = BookStats
+		fields = ('likes', 'bookmarks', 'rates')
+
+	def get_rates(self, stats):
+		return {str(rate): count for rate, count in stats.rates.items()}
+
+
 class BooksSerializer(ModelSerializer):
 
 	likes_count = serializers.IntegerField(read_only=True)
 	rating = serializers.DecimalField(max_digits=3, decimal_places=2, read_only=True)
 	owner_name = serializers.CharField(source='owner.username', default='', read_only=True)
 	readers = BookReadersSerializer(many=True, read_only=True)
+	stats = BookStatsSerializer(source='current_stats', read_only=True)
+	relation = serializers.SerializerMethodField()
+
+	# выводятся, только если перечислены в context['expand'] (?expand=stats,relation)
+	expandable_fields = ('stats', 'relation')
+	# поля, скрытые ?fields= / ?exclude= в ответе сериализатора входных данных
+	hidden_fields = ()
 
 	class Meta:
 		model = Book
 		fields = ('id', 'name' , 'author', 'price',
-		          'likes_count', 'rating', 'owner_name', 'readers')
+		          'likes_count', 'rating', 'owner_name', 'readers', 'stats', 'relation')
+
+	def __init__(self, *args, **kwargs):
+		super().__init__(*args, **kwargs)
+		expand = self.context.get('expand', ())
+		for name in self.expandable_fields:
+			if name not in expand:
+				self.fields.pop(name)
+
+		# ?fields= / ?exclude= (BookViewSet.sparse_fields) сужают только ответ:
+		# при записи все поля принимаются, а лишние убираются из вывода
+		fields, exclude = self.context.get('fields'), self.context.get('exclude', ())
+		hidden = [name for name in self.fields
+		          if fields is not None and name not in fields or name in exclude]
+		if hasattr(self, 'initial_data'):
+			self.hidden_fields = hidden
+		else:
+			for name in hidden:
+				self.fields.pop(name)
+
+	def to_representation(self, instance):
+		data = super().to_representation(instance)
+		for name in self.hidden_fields:
+			data.pop(name, None)
+		return data
+
+	def get_relation(self, book):
+		"""Связь текущего пользователя с книгой из аннотаций store.logic.with_user_relation."""
+		if not hasattr(book, 'user_like'):
+			return None
+		return {'like': bool(book.user_like), 'in_bookmarks': bool(book.user_in_bookmarks),
+		        'rate': book.user_rate}
+
+
+class BookSummarySerializer(ModelSerializer):
+	"""Книга без читателей: для рейтингов и списков, где читатели не нужны."""
+	owner_name = serializers.CharField(source='owner.username', default='', read_only=True)
+
+	class Meta:
+		model = Book
+		fields = ('id', 'name', 'author', 'price', 'likes_count', 'rating', 'owner_name')
+
+
+class BookRankSerializer(ModelSerializer):
+	book = BookSummarySerializer(read_only=True)
+
+	class Meta:
+		model = BookRank
+		fields = ('position', 'score', 'book')
+
+
+class LibraryItemSerializer(ModelSerializer):
+	"""Связь пользователя с книгой для /me/library/."""
+	book = BookSummarySerializer(read_only=True)
+
+	class Meta:
+		model = UserBookRelation
+		fields = ('book', 'like', 'in_bookmarks', 'rate', 'updated_at')
+
+
+class BooksFastSerializer:
+	"""
+	Read-only замена BooksSerializer(many=True) для списка книг.
+
+	Принимает строки queryset.values(*value_fields) и строит те же словари,
+	что и BooksSerializer, без обхода DRF-полей для каждого значения:
+	DecimalField-поля приводятся заранее полученными to_representation,
+	остальные значения уже имеют нужный тип. Читатели всех книг
+	загружаются одним запросом.
+	"""
+	value_fields = ('id', 'name', 'author', 'price', 'likes_count', 'rating',
+	                'owner__username')
+	_decimal_converters = None
+
+	def __init__(self, instance=None, many=True, context=None, **kwargs):
+		assert many, 'BooksFastSerializer supports only many=True'
+		self.instance = instance
+		self.context = context or {}
+
+	@classmethod
+	def decimal_converters(cls):
+		if cls._decimal_converters is None:
+			fields = BooksSerializer().fields
+			cls._decimal_converters = (fields['price'].to_representation,
+			                           fields['rating'].to_representation)
+		return cls._decimal_converters
+
+	@staticmethod
+	def readers_queryset(book_ids):
+		# values(), а не values_list(): в Django 4.1 aiterator() по values_list
+		# выполняет запрос в async-контексте
+		return UserBookRelation.objects.filter(book_id__in=book_ids).order_by('id') \
+			.values('book_id', first_name=F('user__first_name'), last_name=F('user__last_name'))
+
+	@property
+	def data(self):
+		return self.to_representation(self.instance)
+
+	def to_representation(self, instance):
+		rows = list(instance)
+		readers = self.readers_queryset([row['id'] for row in rows]) if rows else ()
+		return self.build(rows, readers)
+
+	@classmethod
+	def build(cls, rows, readers):
+		price, rating = cls.decimal_converters()
+		books_readers = {row['id']: [] for row in rows}
+		for reader in readers:
+			books_readers[reader['book_id']].append(
+				{'first_name': reader['first_name'], 'last_name': reader['last_name']})
+
+		return [{
+			'id': row['id'],
+			'name': row['name'],
+			'author': row['author'],
+			'price': price(row['price']),
+			'likes_count': row['likes_count'],
+			'rating': None if row['rating'] is None else rating(row['rating']),
+			'owner_name': row['owner__username'] or '',
+			'readers': books_readers[row['id']],
+		} for row in rows]
+
+
+class BookReaderRelationSerializer(ModelSerializer):
+	first_name = serializers.CharField(source='user.first_name', read_only=True)
+	last_name = serializers.CharField(source='user.last_name', read_only=True)
+
+	class Meta:
+		model = UserBookRelation
+		fields = ('first_name', 'last_name')
+
+
+class BooksReadersPreviewSerializer(BooksSerializer):
+	"""BooksSerializer с первыми читателями книги вместо полного списка."""
+
+	readers = BookReaderRelationSerializer(source='readers_preview', many=True,
+	                                       read_only=True)
+	readers_count = serializers.IntegerField(read_only=True)
+
+	class Meta(BooksSerializer.Meta):
+		fields = BooksSerializer.Meta.fields + ('readers_count',)
+
+
+class BookPrimaryKeyField(serializers.PrimaryKeyRelatedField):
+	"""
+	Берёт книгу из context['books'], если вьюха загрузила их заранее:
+	при пакетной валидации это экономит запрос на каждый элемент.
+	"""
+
+	def to_internal_value(self, data):
+		books = self.context.get('books')
+		if books is None:
+			return super().to_internal_value(data)
+		if isinstance(data, bool):
+			self.fail('incorrect_type', data_type=type(data).__name__)
+		try:
+			return books[int(data)]
+		except (TypeError, ValueError):
+			self.fail('incorrect_type', data_type=type(data).__name__)
+		except KeyError:
+			self.fail('does_not_exist', pk_value=data)
+
+
+class RelationBulkItemSerializer(serializers.Serializer):
+	"""
+	Форма элемента пакетного изменения связей: словарь с целым id книги.
+	Поля связи и существование книги проверяет UserBookRelationSerializer.
+	"""
+	book = serializers.IntegerField(min_value=1)
 
 
 class UserBookRelationSerializer(ModelSerializer):
+	book = BookPrimaryKeyField(queryset=Book.objects.all())
+
 	class Meta:
 		model = UserBookRelation
 		fields = ('book', 'like', 'in_bookmarks', 'rate')
@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from store.authentication import user_cache
+from store.cache import invalidate_books_on_commit
+from store.logic import apply_relation_change
+from store.models import Book, UserBookRelation
+
+
+@receiver([post_save, post_delete], sender=Book)
+def book_changed(sender, instance, **kwargs):
+	invalidate_books_on_commit([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=UserBookRelation)
+def relation_changed(sender, instance, **kwargs):
+	invalidate_books_on_commit([instance.book_id])
+
+
+@receiver(post_delete, sender=UserBookRelation)
+def relation_deleted(sender, instance, origin=None, **kwargs):
+	# здесь, а не в UserBookRelation.delete: счётчики должны меняться и при
+	# QuerySet.delete() и каскадном удалении (например, пользователя)
+	if is_book_deletion(origin):
+		# книга удаляется вместе со счётчиками
+		return
+	apply_relation_change(instance._counted_values(), None)
+
+
+def is_book_deletion(origin):
+	if isinstance(origin, QuerySet):
+		return origin.model is Book
+	return isinstance(origin, Book)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+	user_cache.invalidate(instance.pk)
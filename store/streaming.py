@@ -0,0 +1,60 @@
+import csv
+import json
+from itertools import islice
+
+from django.db.models import F
+from rest_framework.renderers import JSONRenderer
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_FIELDS = ('id', 'name', 'author', 'price', 'likes_count', 'rating', 'owner_name')
+
+
+class Echo:
+	"""Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+	def write(self, value):
+		return value
+
+
+def export_rows(queryset, chunk_size=2000):
+	"""Строки книг для экспорта; queryset читается через .iterator()."""
+	rows = queryset.annotate(owner_name=F('owner__username')) \
+		.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+	for row in rows:
+		row = dict(zip(EXPORT_FIELDS, row))
+		row['price'] = str(row['price'])
+		row['rating'] = None if row['rating'] is None else str(row['rating'])
+		row['owner_name'] = row['owner_name'] or ''
+		yield row
+
+
+def stream_export(queryset, file_format):
+	"""Генератор фрагментов CSV или JSON Lines для StreamingHttpResponse."""
+	if file_format == 'csv':
+		writer = csv.writer(Echo())
+		yield writer.writerow(EXPORT_FIELDS)
+		for row in export_rows(queryset):
+			yield writer.writerow(row.values())
+	else:
+		for row in export_rows(queryset):
+			yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def stream_json_list(queryset, serializer_class, context=None, chunk_size=500):
+	"""
+	Отдаёт JSON-массив по частям: queryset читается через .iterator()
+	пачками по ``chunk_size``, каждая пачка сериализуется и сразу
+	рендерится, так что в памяти не бывает больше одной пачки.
+	Результат побайтно совпадает с JSONRenderer для всего списка.
+	"""
+	renderer = JSONRenderer()
+	objects = queryset.iterator(chunk_size=chunk_size)
+	separator = b'['
+	while True:
+		chunk = list(islice(objects, chunk_size))
+		if not chunk:
+			break
+		data = serializer_class(chunk, many=True, context=context).data
+		yield separator + b','.join(renderer.render(item) for item in data)
+		separator = b','
+	yield b'[]' if separator == b'[' else b']'
@@ -1,19 +1,32 @@
+from base64 import b64encode, urlsafe_b64encode
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.db import connection
-from django.db.models import Count, Case, When, Avg
 from django.urls import reverse
+from django.utils import timezone
+from django.test import override_settings
 from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from rest_framework.test import APITestCase
 from rest_framework.utils import json
 
+from books import settings_api
+from store.authentication import issue_token
 from store.models import Book, UserBookRelation
 from store.serializers import BooksSerializer
+from store.throttling import RelationWriteThrottle
+from store.views import BookViewSet
 
 
+@override_settings(STORE_QUERY_BUDGETS_STRICT=True)
 class BooksApiTestCase(APITestCase):
 
 	def setUp(self) -> None:
+		cache.clear()
 		# тестовый пользователь для проверки изменения данных в БД
 		self.user = User.objects.create(username='test_user')
 		self.url = reverse('book-list')
@@ -35,10 +48,7 @@ class BooksApiTestCase(APITestCase):
 			resp = self.client.get(self.url)               # который фиксирует запросы указанного соединения.
 			self.assertEqual(2, len(queries))
 
-		books = Book.objects.annotate(
-			likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-			rating=Avg('userbookrelation__rate')
-		).order_by('id')
+		books = Book.objects.order_by('id')
 
 		serializer_data = BooksSerializer(books, many=True).data
 		self.assertEqual(status.HTTP_200_OK, resp.status_code)
@@ -48,34 +58,285 @@ class BooksApiTestCase(APITestCase):
 
 	def test_get_filter(self):
 		resp = self.client.get(self.url, data={'price': 22})
-		books = Book.objects.filter(id=self.b4.id).annotate(
-			likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-			rating=Avg('userbookrelation__rate')
-		)
+		books = Book.objects.filter(id=self.b4.id)
 		serializer_data = BooksSerializer(books, many=True).data
 		self.assertEqual(status.HTTP_200_OK, resp.status_code)
 		self.assertEqual( serializer_data, resp.data)
 
 	def test_search(self):
 		resp = self.client.get(self.url, data={'search': 'Author 1'})
-		books = Book.objects.filter(id__in=[self.b1.id, self.b3.id]).annotate(
-			likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-			rating=Avg('userbookrelation__rate')
-		)
+		books = Book.objects.filter(id__in=[self.b1.id, self.b3.id])
 		serializer_data = BooksSerializer(books, many=True).data
 		self.assertEqual(status.HTTP_200_OK, resp.status_code)
 		self.assertEqual(serializer_data, resp.data)
 
+	def test_search_ranking(self):
+		b5 = Book.objects.create(name='Author 1 biography', price=10.00,
+		                         author='Someone', owner=self.user)
+		resp = self.client.get(self.url, data={'search': 'Author 1'})
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		# совпадение в названии весит больше, чем в авторе
+		self.assertEqual([b5.id, self.b1.id, self.b3.id],
+		                 [book['id'] for book in resp.data])
+
 	def test_ordering(self):
 		resp = self.client.get(self.url, data={'ordering': '-price'})
-		books = Book.objects.filter(id__in=[self.b3.id, self.b1.id, self.b4.id, self.b2.id]).annotate(
-			likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-			rating=Avg('userbookrelation__rate')
-		).order_by('-price')
+		books = Book.objects.filter(id__in=[self.b3.id, self.b1.id, self.b4.id, self.b2.id]).order_by('-price')
 		serializer_data = BooksSerializer(books, many=True).data
 		self.assertEqual(status.HTTP_200_OK, resp.status_code)
 		self.assertEqual(serializer_data, resp.data, )
 
+	def test_cursor_pagination(self):
+		# rating есть только у b1, у остальных NULL - проверяем и tie-breaker,
+		# который идёт по убыванию вслед за rating
+		expected = [self.b1.id, self.b4.id, self.b3.id, self.b2.id]
+		ids, url = [], self.url + '?ordering=-rating&page_size=3'
+		while url:
+			resp = self.client.get(url)
+			self.assertEqual(status.HTTP_200_OK, resp.status_code)
+			ids += [book['id'] for book in resp.data['results']]
+			url = resp.data['next']
+		self.assertEqual(expected, ids)
+
+		resp = self.client.get(resp.data['previous'])
+		self.assertEqual(expected[:3], [book['id'] for book in resp.data['results']])
+		self.assertIsNone(resp.data['previous'])
+
+	def test_cursor_pagination_wrong_ordering(self):
+		resp = self.client.get(self.url, data={'ordering': 'price', 'page_size': 1})
+		resp = self.client.get(resp.data['next'].replace('ordering=price', 'ordering=author'))
+		self.assertEqual(status.HTTP_404_NOT_FOUND, resp.status_code)
+
+	def test_cursor_pagination_tampered(self):
+		def cursor(values):
+			data = {'o': [['price', False], ['id', False]], 'v': values, 'r': False}
+			return urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+		for values in (['abc', 1], [['25.00'], 1], ['25.00', 'x'], ['NaN', 1], [None, 1],
+		               ['25.00', True], [{'a': 1}, 1]):
+			with self.subTest(values=values):
+				resp = self.client.get(self.url, data={'ordering': 'price',
+				                                       'cursor': cursor(values)})
+				self.assertEqual(status.HTTP_404_NOT_FOUND, resp.status_code)
+
+		resp = self.client.get(self.url, data={'ordering': 'price', 'cursor': cursor([22, '1'])})
+		self.assertEqual([self.b4.id, self.b1.id, self.b3.id],
+		                 [book['id'] for book in resp.data['results']])
+
+	def test_readers_preview(self):
+		readers = [User.objects.create(username=f'reader_{i}', first_name=f'Reader {i}')
+		           for i in range(7)]
+		for reader in readers:
+			UserBookRelation.objects.create(user=reader, book=self.b2)
+
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.get(self.url, data={'readers': 'preview'})
+			self.assertEqual(2, len(queries))
+
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		books = {book['id']: book for book in resp.data}
+		self.assertEqual(7, books[self.b2.id]['readers_count'])
+		self.assertEqual(['Reader 0', 'Reader 1', 'Reader 2', 'Reader 3', 'Reader 4'],
+		                 [r['first_name'] for r in books[self.b2.id]['readers']])
+		self.assertEqual(1, books[self.b1.id]['readers_count'])
+		self.assertEqual(0, books[self.b3.id]['readers_count'])
+		self.assertEqual([], books[self.b3.id]['readers'])
+
+	def test_readers(self):
+		for i in range(3):
+			reader = User.objects.create(username=f'reader_{i}', first_name=f'Reader {i}')
+			UserBookRelation.objects.create(user=reader, book=self.b1)
+
+		url = reverse('book-readers', args=(self.b1.id,))
+		resp = self.client.get(url, data={'page_size': 2})
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertEqual(['', 'Reader 0'], [r['first_name'] for r in resp.data['results']])
+		resp = self.client.get(resp.data['next'])
+		self.assertEqual(['Reader 1', 'Reader 2'], [r['first_name'] for r in resp.data['results']])
+		self.assertIsNone(resp.data['next'])
+
+	def test_stats(self):
+		UserBookRelation.objects.create(user=User.objects.create(username='reader'),
+		                                book=self.b1, in_bookmarks=True, rate=3)
+		expected = {'likes': 1, 'bookmarks': 1,
+		            'rates': {'1': 0, '2': 0, '3': 1, '4': 0, '5': 1}}
+
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.get(reverse('book-stats', args=(self.b1.id,)))
+			self.assertEqual(1, len(queries))
+		self.assertEqual(expected, resp.data)
+
+		resp = self.client.get(self.url, data={'expand': 'stats', 'ordering': 'price'})
+		with CaptureQueriesContext(connection) as queries:
+			self.client.get(self.url, data={'expand': 'stats'})
+			self.assertEqual(2, len(queries))
+		books = {book['id']: book for book in resp.data}
+		self.assertEqual(expected, books[self.b1.id]['stats'])
+		self.assertEqual(0, books[self.b2.id]['stats']['likes'])
+		self.assertNotIn('stats', self.client.get(self.url).data[0])
+
+		resp = self.client.get(reverse('book-stats', args=(100500,)))
+		self.assertEqual(status.HTTP_404_NOT_FOUND, resp.status_code)
+
+	def test_expand_relation(self):
+		other = User.objects.create(username='other')
+		UserBookRelation.objects.create(user=other, book=self.b2, in_bookmarks=True, rate=2)
+		data = {'expand': 'relation', 'ordering': 'price'}
+
+		self.client.force_login(self.user)
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.get(self.url, data=data)
+		# сессия, пользователь, книги, читатели - независимо от числа книг
+		self.assertEqual(4, len(queries))
+		relations = {book['id']: book['relation'] for book in resp.data}
+		self.assertEqual({'like': True, 'in_bookmarks': False, 'rate': 5}, relations[self.b1.id])
+		self.assertEqual({'like': False, 'in_bookmarks': False, 'rate': None},
+		                 relations[self.b2.id])
+
+		# ответ из кэша не достаётся другому пользователю
+		self.client.force_login(other)
+		resp = self.client.get(self.url, data=data)
+		relations = {book['id']: book['relation'] for book in resp.data}
+		self.assertEqual({'like': False, 'in_bookmarks': True, 'rate': 2}, relations[self.b2.id])
+		self.assertFalse(relations[self.b1.id]['like'])
+
+		self.client.logout()
+		self.assertIsNone(self.client.get(self.url, data=data).data[0]['relation'])
+
+	def test_sparse_fields(self):
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.get(self.url, data={'fields': 'id,name,price', 'ordering': 'price'})
+		# без prefetch читателей и JOIN владельца
+		self.assertEqual(1, len(queries))
+		self.assertNotIn('owner', queries[0]['sql'])
+		self.assertNotIn('"likes_count"', queries[0]['sql'].split('FROM')[0])
+		self.assertEqual({'id': self.b2.id, 'name': 'TestBook2', 'price': '19.00'}, resp.data[0])
+
+		resp = self.client.get(self.url, data={'exclude': 'readers,owner_name', 'page_size': 2})
+		self.assertEqual(['id', 'name', 'author', 'price', 'likes_count', 'rating'],
+		                 list(resp.data['results'][0]))
+		resp = self.client.get(resp.data['next'])
+		self.assertEqual(2, len(resp.data['results']))
+
+		resp = self.client.get(self.url, data={'fields': 'id,readers,readers_count',
+		                                       'readers': 'preview'})
+		self.assertEqual(['id', 'readers', 'readers_count'], list(resp.data[0]))
+
+	def test_sparse_fields_write(self):
+		# ?fields= / ?exclude= не отбрасывают принимаемые поля
+		self.client.force_login(self.user)
+		url = reverse('book-detail', args=(self.b1.id,))
+		resp = self.client.patch(url + '?fields=id,price', data={'name': 'NEW', 'price': 5},
+		                         format='json')
+		self.assertEqual({'id': self.b1.id, 'price': '5.00'}, resp.data)
+		self.b1.refresh_from_db()
+		self.assertEqual(('NEW', 5), (self.b1.name, self.b1.price))
+
+		resp = self.client.put(url + '?exclude=name,readers',
+		                       data={'name': 'NEWER', 'price': 6, 'author': 'A'}, format='json')
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertNotIn('name', resp.data)
+		self.assertNotIn('readers', resp.data)
+		self.b1.refresh_from_db()
+		self.assertEqual(('NEWER', 'A'), (self.b1.name, self.b1.author))
+
+		resp = self.client.post(self.url + '?fields=id',
+		                        data={'name': 'Created', 'price': 7, 'author': 'B'}, format='json')
+		self.assertEqual(status.HTTP_201_CREATED, resp.status_code)
+		self.assertEqual(['id'], list(resp.data))
+		self.assertEqual('Created', Book.objects.get(pk=resp.data['id']).name)
+
+	def test_last_modified(self):
+		url = reverse('book-detail', args=(self.b1.id,))
+		Book.objects.filter(pk=self.b1.pk).update(updated_at=timezone.now() - timedelta(days=1))
+		resp = self.client.get(url)
+		last_modified = resp['Last-Modified']
+
+		with CaptureQueriesContext(connection) as queries:
+			not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+			self.assertEqual(0, len(queries))
+		self.assertEqual(status.HTTP_304_NOT_MODIFIED, not_modified.status_code)
+		self.assertEqual(last_modified, not_modified['Last-Modified'])
+
+		# связь меняет updated_at книги
+		UserBookRelation.objects.create(user=User.objects.create(username='reader'), book=self.b1)
+		resp = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertEqual(2, len(resp.data['readers']))
+
+	def test_response_cache(self):
+		url = reverse('book-detail', args=(self.b1.id,))
+		resp = self.client.get(url)
+		etag = resp['ETag']
+
+		with CaptureQueriesContext(connection) as queries:
+			cached = self.client.get(url)
+			not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+			self.assertEqual(0, len(queries))
+		self.assertEqual(resp.data, cached.data)
+		self.assertEqual(status.HTTP_304_NOT_MODIFIED, not_modified.status_code)
+
+		# лайк меняет likes_count - кэш и ETag должны сброситься
+		UserBookRelation.objects.create(user=User.objects.create(username='reader'),
+		                                book=self.b1, like=True)
+		resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertNotEqual(etag, resp['ETag'])
+		self.assertEqual(2, resp.data['likes_count'])
+
+	def test_response_cache_unnormalized_pk(self):
+		# /book/01/ - та же книга, её ответ сбрасывается вместе с версией книги
+		url = f'{self.url}0{self.b1.id}/'
+		self.assertEqual('TestBook1', self.client.get(url).data['name'])
+		self.b1.name = 'Renamed'
+		self.b1.save()
+		self.assertEqual('Renamed', self.client.get(url).data['name'])
+
+	def test_response_cache_list_invalidation(self):
+		self.client.get(self.url, data={'ordering': 'price'})
+		self.client.force_login(self.user)
+		url = reverse('book-detail', args=(self.b2.id,))
+		self.client.patch(url, data=json.dumps({'price': 99}),
+		                  content_type='application/json')
+
+		resp = self.client.get(self.url, data={'ordering': 'price'})
+		self.assertEqual(self.b2.id, resp.data[-1]['id'])
+
+	def test_stream(self):
+		UserBookRelation.objects.create(user=User.objects.create(username='reader'),
+		                                book=self.b2, rate=3)
+		expected = self.client.get(self.url, data={'ordering': 'author'}).content
+
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.get(self.url, data={'ordering': 'author', 'stream': 'true'})
+			content = b''.join(resp.streaming_content)
+			self.assertEqual(2, len(queries))
+		self.assertEqual(expected, content)
+
+		resp = self.client.get(self.url, data={'price': 1, 'stream': 'true'})
+		self.assertEqual(b'[]', b''.join(resp.streaming_content))
+
+	def test_fast_list(self):
+		reader = User.objects.create(username='reader', first_name='Ivan', last_name='Ivanov')
+		UserBookRelation.objects.create(user=reader, book=self.b1, rate=2)
+		UserBookRelation.objects.create(user=reader, book=self.b2, like=True)
+		params = [{}, {'ordering': '-rating'}, {'search': 'Author 1'},
+		          {'price': 22}, {'ordering': 'author', 'page_size': 2},
+		          {'stream': 'true'}, {'readers': 'preview'},
+		          {'readers': 'preview', 'page_size': 2}]
+
+		def get(data):
+			cache.clear()
+			with CaptureQueriesContext(connection) as queries:
+				resp = self.client.get(self.url, data=data)
+				content = b''.join(resp.streaming_content) if resp.streaming else resp.content
+			return content, len(queries)
+
+		expected = [get(data) for data in params]
+		with mock.patch.object(BookViewSet, 'fast_list', True):
+			# ответ побайтно совпадает, число запросов не растёт
+			self.assertEqual(expected, [get(data) for data in params])
+
 	def test_create(self):
 		self.client.force_login(self.user) # авторизиация пользователя
 		data = {
@@ -91,6 +352,47 @@ class BooksApiTestCase(APITestCase):
 		self.assertEqual(5, Book.objects.count())
 		self.assertEqual(self.user, Book.objects.last().owner)
 
+	def test_import_csv(self):
+		self.client.force_login(self.user)
+		url = reverse('book-import-books')
+		data = ('name,author,price\n'
+		        'Book A,Author A,10.50\n'
+		        'Book B,Author B,not a price\n'
+		        'Book C,Author C,7\n')
+		resp = self.client.post(url, data=data, content_type='text/csv')
+
+		self.assertEqual(status.HTTP_200_OK, resp.status_code, resp.data)
+		self.assertEqual(2, resp.data['created'])
+		self.assertEqual(1, resp.data['invalid'])
+		self.assertEqual(3, resp.data['errors'][0]['row'])
+		self.assertIn('price', resp.data['errors'][0]['errors'])
+		self.assertEqual(self.user, Book.objects.get(name='Book C').owner)
+
+	def test_import_jsonl(self):
+		self.client.force_login(self.user)
+		url = reverse('book-import-books')
+		data = ('{"name": "Book A", "author": "Author A", "price": 10}\n'
+		        '{broken\n')
+		resp = self.client.post(url, data=data, content_type='application/x-ndjson')
+
+		self.assertEqual(1, resp.data['created'])
+		self.assertEqual([{'row': 2, 'errors': {'non_field_errors': ['Invalid JSON.']}}],
+		                 resp.data['errors'])
+
+	def test_export(self):
+		url = reverse('book-export-books')
+		resp = self.client.get(url, data={'file_format': 'jsonl', 'price': 25})
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		rows = [json.loads(line) for line in b''.join(resp.streaming_content).splitlines()]
+		self.assertEqual([{'id': self.b1.id, 'name': 'TestBook1', 'author': 'Author 1',
+		                   'price': '25.00', 'likes_count': 1, 'rating': '5.00',
+		                   'owner_name': 'test_user'}], rows)
+
+		resp = self.client.get(url)
+		lines = b''.join(resp.streaming_content).decode().splitlines()
+		self.assertEqual('id,name,author,price,likes_count,rating,owner_name', lines[0])
+		self.assertEqual(5, len(lines))
+
 	def test_update(self):
 		self.client.force_login(self.user)  # авторизиация пользователя
 
@@ -157,6 +459,37 @@ class BooksApiTestCase(APITestCase):
 		resp_check_del = self.client.get(url)
 		self.assertEqual(status.HTTP_404_NOT_FOUND, resp_check_del.status_code)
 
+	def test_write_queries(self):
+		# force_authenticate: без запросов сессии и пользователя
+		self.client.force_authenticate(self.user)
+		reader = User.objects.create(username='reader', first_name='Ivan')
+		UserBookRelation.objects.create(user=reader, book=self.b1)
+		url = reverse('book-detail', args=(self.b1.id,))
+
+		def request(method, data=None):
+			with CaptureQueriesContext(connection) as queries:
+				resp = getattr(self.client, method)(url, data=data, format='json')
+			return resp, len(queries)
+
+		# книга без связанных данных, UPDATE, книга с владельцем и читатели для ответа
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.put(url, data={'name': 'TestBook1', 'price': 1500,
+			                                  'author': 'Author 1'}, format='json')
+		self.assertEqual((status.HTTP_200_OK, 4), (resp.status_code, len(queries)))
+		lookup = queries.captured_queries[0]['sql']
+		self.assertNotIn('JOIN', lookup)
+		self.assertNotIn('likes_count', lookup)
+		# читатели в порядке связей, как в списке
+		self.assertEqual(['', 'Ivan'], [reader['first_name'] for reader in resp.data['readers']])
+		resp, queries = request('patch', {'price': 1600})
+		self.assertEqual((status.HTTP_200_OK, 4), (resp.status_code, queries))
+		self.assertEqual('1600.00', resp.data['price'])
+		self.assertEqual(self.client.get(url).data, resp.data)
+
+		# книга (id и owner_id), связи, 5 DELETE
+		resp, queries = request('delete')
+		self.assertEqual((status.HTTP_204_NO_CONTENT, 7), (resp.status_code, queries))
+
 	def test_delete_not_owner(self):
 		user = User.objects.create(username='test_user_2')
 		self.client.force_login(user)  # авторизиация пользователя
@@ -168,6 +501,7 @@ class BooksApiTestCase(APITestCase):
 		self.assertEqual(4, Book.objects.count())
 
 
+@override_settings(STORE_QUERY_BUDGETS_STRICT=True)
 class BooksRalationTestCase(APITestCase):
 	def setUp(self) -> None:
 		# тестовые пользователи для проверки изменения данных в БД
@@ -181,6 +515,25 @@ class BooksRalationTestCase(APITestCase):
 		                         author='Author 2', owner=self.user)
 		self.url = reverse('userbookrelation-detail', args=(self.b1.id,))
 
+	def test_throttle(self):
+		cache.clear()
+		data = json.dumps({'like': True})
+		with mock.patch.object(RelationWriteThrottle, 'THROTTLE_RATES',
+		                       {'relation_write': '2/min'}):
+			for _ in range(2):
+				resp = self.client.patch(self.url, data=data, content_type='application/json')
+				self.assertEqual(status.HTTP_200_OK, resp.status_code)
+			resp = self.client.patch(self.url, data=data, content_type='application/json')
+			self.assertEqual(status.HTTP_429_TOO_MANY_REQUESTS, resp.status_code)
+			self.assertIn('Retry-After', resp)
+
+			# лимит у каждого пользователя свой, чтения книг не ограничены
+			self.client.force_login(self.user2)
+			resp = self.client.patch(self.url, data=data, content_type='application/json')
+			self.assertEqual(status.HTTP_200_OK, resp.status_code)
+			self.assertEqual(status.HTTP_200_OK,
+			                 self.client.get(reverse('book-detail', args=(self.b1.id,))).status_code)
+
 	def test_like_bookmarks(self):
 		json_data = json.dumps( {"like": True} )  # Преобразует словарь в объект JSON
 		resp = self.client.patch(self.url, data=json_data,
@@ -224,4 +577,137 @@ class BooksRalationTestCase(APITestCase):
 		self.b1.refresh_from_db() # Обновляет объект данными из БД
 		relation = UserBookRelation.objects.get(user=self.user,
 		                                        book=self.b1)
-		self.assertEqual(None, relation.rate, resp.data)
\ No newline at end of file
+		self.assertEqual(None, relation.rate, resp.data)
+
+	def test_counters(self):
+		self.client.patch(self.url, data=json.dumps({"like": True, "rate": 4}),
+		                  content_type='application/json')
+		self.client.force_login(self.user2)
+		self.client.patch(self.url, data=json.dumps({"like": True, "rate": 5}),
+		                  content_type='application/json')
+		self.b1.refresh_from_db()
+		self.assertEqual(2, self.b1.likes_count)
+		self.assertEqual(Decimal('4.50'), self.b1.rating)
+
+		# снятие лайка и смена оценки сдвигают счётчики, а не добавляют
+		self.client.patch(self.url, data=json.dumps({"like": False, "rate": 1}),
+		                  content_type='application/json')
+		self.b1.refresh_from_db()
+		self.assertEqual(1, self.b1.likes_count)
+		self.assertEqual(2, self.b1.rates_count)
+		self.assertEqual(Decimal('2.50'), self.b1.rating)
+
+	def test_bulk(self):
+		UserBookRelation.objects.create(user=self.user, book=self.b1, like=True, rate=3)
+		url = reverse('userbookrelation-bulk')
+		data = [
+			{"book": self.b1.id, "rate": 5},
+			{"book": self.b2.id, "like": True, "in_bookmarks": True},
+			{"book": self.b2.id, "in_bookmarks": False},
+			{"book": self.b1.id, "rate": 0},
+			{"book": 100500, "like": True},
+		]
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.post(url, data=json.dumps(data),
+			                        content_type='application/json')
+		self.assertEqual(status.HTTP_200_OK, resp.status_code, resp.data)
+		self.assertLess(len(queries), 15)
+		self.assertEqual(['updated', 'created', 'created', 'invalid', 'invalid'],
+		                 [result['status'] for result in resp.data['results']])
+		self.assertIn('rate', resp.data['results'][3]['errors'])
+
+		relation1 = UserBookRelation.objects.get(user=self.user, book=self.b1)
+		relation2 = UserBookRelation.objects.get(user=self.user, book=self.b2)
+		# не переданные поля не затираются, последнее изменение побеждает
+		self.assertEqual((True, 5), (relation1.like, relation1.rate))
+		self.assertEqual((True, False), (relation2.like, relation2.in_bookmarks))
+		self.b1.refresh_from_db()
+		self.b2.refresh_from_db()
+		self.assertEqual(Decimal('5.00'), self.b1.rating)
+		self.assertEqual(1, self.b2.likes_count)
+
+	def test_bulk_malformed(self):
+		url = reverse('userbookrelation-bulk')
+
+		def post(data):
+			return self.client.post(url, data=json.dumps(data), content_type='application/json')
+
+		# строковый id принимается, как и в PATCH
+		resp = post([{'book': str(self.b1.id), 'like': True}])
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertEqual([{'book': self.b1.id, 'status': 'created'}], resp.data['results'])
+
+		for data in ([{'book': [self.b1.id]}], [{'book': {'id': 1}}], [{'like': True}],
+		             [{'book': 'abc'}], [{'book': True}], [1]):
+			with self.subTest(data=data):
+				resp = post([{'book': self.b2.id, 'like': True}] + data)
+				self.assertEqual(status.HTTP_400_BAD_REQUEST, resp.status_code)
+				self.assertEqual({}, resp.data[0])
+				self.assertTrue(resp.data[1])
+		self.assertFalse(UserBookRelation.objects.filter(book=self.b2).exists())
+
+	def test_library(self):
+		b3 = Book.objects.create(name='TestBook3', price=30.00, author='Author 3')
+		UserBookRelation.objects.create(user=self.user, book=self.b1, like=True, rate=4)
+		UserBookRelation.objects.create(user=self.user, book=self.b2, in_bookmarks=True)
+		UserBookRelation.objects.create(user=self.user, book=b3)
+		UserBookRelation.objects.create(user=self.user2, book=b3, like=True)
+		url = reverse('library-list')
+
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.get(url)
+		# сессия, пользователь и сама выборка
+		self.assertEqual(3, len(queries))
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertEqual([self.b2.id, self.b1.id],
+		                 [item['book']['id'] for item in resp.data['results']])
+		book = resp.data['results'][1]['book']
+		self.assertEqual((1, '4.00', 'test_user'),
+		                 (book['likes_count'], book['rating'], book['owner_name']))
+
+		for shelf, expected in (('bookmarks', [self.b2.id]), ('likes', [self.b1.id]),
+		                        ('rated', [self.b1.id])):
+			resp = self.client.get(url, data={'shelf': shelf})
+			self.assertEqual(expected, [item['book']['id'] for item in resp.data['results']])
+
+		resp = self.client.get(url, data={'shelf': 'unknown'})
+		self.assertEqual(status.HTTP_400_BAD_REQUEST, resp.status_code)
+		self.client.logout()
+		self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(url).status_code)
+
+
+@override_settings(ROOT_URLCONF='books.urls_api', MIDDLEWARE=settings_api.MIDDLEWARE,
+                   REST_FRAMEWORK=settings_api.REST_FRAMEWORK)
+class ApiProfileTestCase(APITestCase):
+	def setUp(self) -> None:
+		self.user = User.objects.create_user(username='test_user', password='secret')
+		self.book = Book.objects.create(name='TestBook1', price=25, author='Author 1')
+		self.auth = 'Basic ' + b64encode(b'test_user:secret').decode()
+		self.client.credentials(HTTP_AUTHORIZATION=self.auth)
+
+	def test_api_profile(self):
+		self.assertEqual(status.HTTP_404_NOT_FOUND, self.client.get('/admin/').status_code)
+		resp = self.client.get(reverse('book-list'))
+		self.assertEqual([self.book.id], [book['id'] for book in resp.data])
+
+		# без сессий и CSRF
+		client = self.client_class(enforce_csrf_checks=True)
+		client.credentials(HTTP_AUTHORIZATION=self.auth)
+		resp = client.patch(reverse('userbookrelation-detail', args=(self.book.id,)),
+		                    data=json.dumps({'like': True}), content_type='application/json')
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertTrue(UserBookRelation.objects.get(user=self.user).like)
+
+	def test_async_relation(self):
+		# без AuthenticationMiddleware пользователь определяется по заголовку
+		url = reverse('async-book-relation', args=(self.book.id,))
+		relation = {'book': self.book.id, 'like': False, 'in_bookmarks': False, 'rate': None}
+		self.assertEqual(relation, self.client.get(url).json())
+
+		self.client.credentials(HTTP_AUTHORIZATION=f'Token {issue_token(self.user)}')
+		self.assertEqual(relation, self.client.get(url).json())
+
+		self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+		self.assertEqual(status.HTTP_401_UNAUTHORIZED, self.client.get(url).status_code)
+		self.client.credentials()
+		self.assertEqual(status.HTTP_403_FORBIDDEN, self.client.get(url).status_code)
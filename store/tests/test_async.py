@@ -0,0 +1,89 @@
+import os
+import subprocess
+import sys
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.base import BaseHandler
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from books import settings_api
+from store.models import Book, UserBookRelation
+
+
+class AsyncBooksApiTestCase(TestCase):
+	def setUp(self) -> None:
+		self.user = User.objects.create(username='test_user', first_name='Ivan')
+		self.b1 = Book.objects.create(name='TestBook1', price=25.00,
+		                              author='Author 1', owner=self.user)
+		self.b2 = Book.objects.create(name='TestBook2', price=19.00,
+		                              author='Author 2')
+		UserBookRelation.objects.create(user=self.user, book=self.b1, like=True, rate=4)
+
+	async def test_list_same_as_sync(self):
+		for data in ({}, {'ordering': '-price'}, {'price': '19'}):
+			expected = await self.async_client.get(reverse('book-list'), data)
+			resp = await self.async_client.get(reverse('async-book-list'), data)
+			self.assertEqual(200, resp.status_code)
+			self.assertEqual(expected.content, resp.content, data)
+
+	async def test_list_invalid_price(self):
+		for price in ('abc', 'NaN', 'Infinity', '1e999999', '123456789', '1.234'):
+			expected = await self.async_client.get(reverse('book-list'), {'price': price})
+			resp = await self.async_client.get(reverse('async-book-list'), {'price': price})
+			self.assertEqual(400, resp.status_code, price)
+			self.assertEqual(expected.json(), resp.json(), price)
+
+	async def test_detail(self):
+		expected = await self.async_client.get(reverse('book-detail', args=(self.b1.id,)))
+		resp = await self.async_client.get(reverse('async-book-detail', args=(self.b1.id,)))
+		self.assertEqual(expected.content, resp.content)
+
+		resp = await self.async_client.get(reverse('async-book-detail', args=(100500,)))
+		self.assertEqual(404, resp.status_code)
+
+	async def test_relation(self):
+		url = reverse('async-book-relation', args=(self.b1.id,))
+		resp = await self.async_client.get(url)
+		self.assertEqual(403, resp.status_code)
+
+		await sync_to_async(self.async_client.force_login)(self.user)
+		resp = await self.async_client.get(url)
+		self.assertEqual({'book': self.b1.id, 'like': True, 'in_bookmarks': False, 'rate': 4},
+		                 resp.json())
+		resp = await self.async_client.get(reverse('async-book-relation', args=(self.b2.id,)))
+		self.assertEqual({'book': self.b2.id, 'like': False, 'in_bookmarks': False, 'rate': None},
+		                 resp.json())
+
+	async def test_metrics(self):
+		resp = await self.async_client.get(reverse('async-book-detail', args=(self.b1.id,)))
+		self.assertRegex(resp['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+	@override_settings(DEBUG=True)
+	def test_middleware_not_adapted(self):
+		# при DEBUG Django логирует каждую middleware, обёрнутую в async_to_sync
+		for middleware in (settings.MIDDLEWARE, settings_api.MIDDLEWARE):
+			with self.subTest(middleware=middleware), override_settings(MIDDLEWARE=middleware), \
+					self.assertNoLogs('django.request', 'DEBUG'):
+				BaseHandler().load_middleware(is_async=True)
+
+
+class AsgiSettingsTestCase(SimpleTestCase):
+	def conn_max_age(self, module):
+		env = {key: value for key, value in os.environ.items()
+		       if key not in ('DJANGO_SETTINGS_MODULE', 'DATABASE_CONN_MAX_AGE',
+		                      'STORE_SERVER_INTERFACE')}
+		env.update(SECRET_KEY='test', DATABASE_USER='', DATABASE_PASSWORD='')
+		script = (f'import {module}; from django.conf import settings; '
+		          f'print(settings.DATABASES["default"]["CONN_MAX_AGE"])')
+		result = subprocess.run([sys.executable, '-c', script], env=env, check=True,
+		                        capture_output=True, text=True)
+		return int(result.stdout)
+
+	def test_conn_max_age(self):
+		# под ASGI постоянные соединения по умолчанию выключены
+		self.assertEqual(0, self.conn_max_age('books.asgi'))
+		self.assertEqual(0, self.conn_max_age('books.asgi_api'))
+		self.assertEqual(60, self.conn_max_age('books.wsgi'))
@@ -0,0 +1,103 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework.utils import json
+
+from store.authentication import UserCache, user_cache
+from store.models import Book, UserBookRelation
+
+
+class SignedTokenAuthenticationTestCase(APITestCase):
+	def setUp(self) -> None:
+		user_cache.clear()
+		self.user = User.objects.create_user(username='test_user', password='secret')
+		self.book = Book.objects.create(name='TestBook1', price=25, author='Author 1',
+		                                owner=self.user)
+		self.token = self.get_token('secret')
+		self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+
+	def get_token(self, password):
+		resp = self.client.post(reverse('auth-token'), format='json',
+		                        data={'username': 'test_user', 'password': password})
+		return resp.data.get('token')
+
+	def patch(self, url, data):
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.patch(url, data=json.dumps(data), content_type='application/json')
+		# загрузка пользователя (единственный запрос с паролем) или сессии
+		auth = [query['sql'] for query in queries
+		        if '"auth_user"."password"' in query['sql'] or 'django_session' in query['sql']]
+		return resp, auth
+
+	def test_token(self):
+		self.assertIsNotNone(self.token)
+		self.assertIsNone(self.get_token('wrong'))
+		self.client.credentials(HTTP_AUTHORIZATION='Token invalid')
+		resp = self.client.patch(reverse('userbookrelation-detail', args=(self.book.id,)))
+		# первой в DEFAULT_AUTHENTICATION_CLASSES стоит сессия, поэтому 403, а не 401
+		self.assertEqual(status.HTTP_403_FORBIDDEN, resp.status_code)
+		self.assertEqual('Invalid token.', resp.data['detail'])
+		with override_settings(STORE_TOKEN_MAX_AGE=-1):
+			self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+			resp = self.client.patch(reverse('userbookrelation-detail', args=(self.book.id,)))
+			self.assertEqual('Token has expired.', resp.data['detail'])
+
+	def test_no_auth_queries(self):
+		url = reverse('userbookrelation-detail', args=(self.book.id,))
+		resp, auth = self.patch(url, {'like': True})
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertEqual(1, len(auth))
+
+		# пользователь из кэша: IsAuthenticated и IsOwnerOrStaffOrReadOnly без запросов
+		resp, auth = self.patch(url, {'rate': 5})
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertEqual([], auth)
+		self.assertEqual(5, UserBookRelation.objects.get(user=self.user).rate)
+
+		resp, auth = self.patch(reverse('book-detail', args=(self.book.id,)) + '?fields=id,price',
+		                        {'price': 30})
+		self.assertEqual({'id': self.book.id, 'price': '30.00'}, resp.data)
+		self.assertEqual([], auth)
+
+	def test_invalidation(self):
+		url = reverse('userbookrelation-detail', args=(self.book.id,))
+		self.patch(url, {'like': True})
+
+		# смена пароля отзывает токен
+		self.user.set_password('new secret')
+		self.user.save()
+		resp, auth = self.patch(url, {'like': False})
+		self.assertEqual(status.HTTP_403_FORBIDDEN, resp.status_code)
+
+		self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.get_token("new secret")}')
+		resp, auth = self.patch(url, {'like': False})
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+
+		self.user.is_active = False
+		self.user.save()
+		resp, auth = self.patch(url, {'like': True})
+		self.assertEqual(status.HTTP_403_FORBIDDEN, resp.status_code)
+
+
+class UserCacheTestCase(SimpleTestCase):
+	def test_ttl_and_lru(self):
+		cache = UserCache(maxsize=2, ttl=60)
+		users = [User(pk=pk) for pk in range(1, 4)]
+		with mock.patch('store.authentication.time.monotonic', return_value=0):
+			cache.set(users[0])
+			cache.set(users[1])
+			self.assertIs(users[0], cache.get(1))
+			# вытесняется давно не использованный
+			cache.set(users[2])
+			self.assertEqual([users[0], None, users[2]], [cache.get(pk) for pk in range(1, 4)])
+			cache.invalidate(3)
+			self.assertIsNone(cache.get(3))
+		with mock.patch('store.authentication.time.monotonic', return_value=61):
+			self.assertIsNone(cache.get(1))
+		self.assertFalse(cache.users)
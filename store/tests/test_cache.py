@@ -0,0 +1,69 @@
+import threading
+import time
+
+from django.test import SimpleTestCase
+
+from store.cache import SingleFlight
+
+
+class SingleFlightTestCase(SimpleTestCase):
+	def wait_for(self, condition, timeout=5):
+		deadline = time.monotonic() + timeout
+		while not condition():
+			self.assertLess(time.monotonic(), deadline)
+			time.sleep(0.001)
+
+	def test_coalesce(self):
+		flight = SingleFlight()
+		release = threading.Event()
+		calls = []
+		results = []
+
+		def compute():
+			calls.append(1)
+			release.wait(5)
+			return {'id': 1}
+
+		threads = [threading.Thread(target=lambda: results.append(flight.do('book:1', compute)))
+		           for _ in range(5)]
+		threads[0].start()
+		self.wait_for(lambda: 'book:1' in flight.calls)
+		for thread in threads[1:]:
+			thread.start()
+		self.wait_for(lambda: flight.calls['book:1'].waiters == 4)
+		# другой ключ вычисляется независимо
+		self.assertEqual(({'id': 1}, False), flight.do('book:2', lambda: {'id': 1}))
+		release.set()
+		for thread in threads:
+			thread.join()
+
+		self.assertEqual(1, len(calls))
+		self.assertEqual([False, True, True, True, True],
+		                 sorted(shared for result, shared in results))
+		self.assertEqual({'id': 1}, results[0][0])
+		self.assertFalse(flight.calls)
+
+	def test_leader_failed(self):
+		flight = SingleFlight()
+		release = threading.Event()
+		results = []
+
+		def fail():
+			release.wait(5)
+			raise ValueError
+
+		def leader():
+			with self.assertRaises(ValueError):
+				flight.do('book:1', fail)
+
+		threads = [threading.Thread(target=leader),
+		           threading.Thread(target=lambda: results.append(flight.do('book:1', lambda: 1)))]
+		threads[0].start()
+		self.wait_for(lambda: 'book:1' in flight.calls)
+		threads[1].start()
+		self.wait_for(lambda: flight.calls['book:1'].waiters == 1)
+		release.set()
+		for thread in threads:
+			thread.join()
+		# ожидающий запрос вычисляет значение сам
+		self.assertEqual([(1, False)], results)
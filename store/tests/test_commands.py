@@ -0,0 +1,128 @@
+import json
+from decimal import Decimal
+from io import StringIO
+from tempfile import NamedTemporaryFile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from store.cache import GENERATION_KEY, get_versions
+from store.models import Book, UserBookRelation
+from store.throttling import RelationWriteThrottle
+from store.views import UserBookRelationView
+
+
+class RebuildBookCountersCommandTestCase(TestCase):
+	def setUp(self) -> None:
+		self.user1 = User.objects.create(username='test_user1')
+		self.user2 = User.objects.create(username='test_user2')
+		self.book = Book.objects.create(name='TestBook1', price=25.00,
+		                                author='Author 1')
+
+	def test_command(self):
+		UserBookRelation.objects.create(user=self.user1, book=self.book,
+		                                like=True, rate=5)
+		UserBookRelation.objects.create(user=self.user2, book=self.book, rate=4)
+		# рассинхронизируем счётчики в обход модели
+		Book.objects.update(likes_count=10, rates_sum=0, rates_count=0, rating=None)
+
+		generation = get_versions(GENERATION_KEY)
+		out = StringIO()
+		call_command('rebuild_book_counters', batch_size=1, stdout=out)
+		self.assertNotEqual(generation, get_versions(GENERATION_KEY))
+
+		self.book.refresh_from_db()
+		self.assertEqual(1, self.book.likes_count)
+		self.assertEqual(2, self.book.rates_count)
+		self.assertEqual(Decimal('4.50'), self.book.rating)
+		self.assertIn('Rebuilt counters for 1 books', out.getvalue())
+
+
+class ImportBooksCommandTestCase(TestCase):
+	def test_import(self):
+		user = User.objects.create(username='importer')
+		generation = get_versions(GENERATION_KEY)
+		with NamedTemporaryFile('w', suffix='.csv') as file:
+			file.write('name,author,price\nBook A,Author A,1\nBook B,,2\nBook C,Author C,3\n')
+			file.flush()
+			out, err = StringIO(), StringIO()
+			call_command('import_books', file.name, owner='importer', batch_size=2,
+			             stdout=out, stderr=err)
+
+		self.assertEqual(['Book A', 'Book C'],
+		                 list(Book.objects.filter(owner=user).order_by('id')
+		                      .values_list('name', flat=True)))
+		self.assertIn('Created 2 books, skipped 1 invalid rows', out.getvalue())
+		self.assertIn('row 3', err.getvalue())
+		self.assertNotEqual(generation, get_versions(GENERATION_KEY))
+
+
+class BenchmarkConnectionsCommandTestCase(TestCase):
+	def test_command(self):
+		Book.objects.create(name='TestBook1', price=25.00, author='Author 1')
+		out = StringIO()
+		call_command('benchmark_connections', requests=3, stdout=out)
+		lines = out.getvalue().splitlines()
+		self.assertEqual(['mode', 'p50', 'p95', 'p99', 'connects'], lines[0].split())
+		self.assertEqual(['per-request', 'persistent'], [line.split()[0] for line in lines[1:]])
+
+
+class BenchmarkCommandTestCase(TestCase):
+	def run_benchmark(self, **options):
+		out = StringIO()
+		call_command('benchmark', books=30, users=5, relations=40, requests=2, stdout=out,
+		             stderr=StringIO(), **options)
+		return json.loads(out.getvalue())
+
+	def queries(self, report):
+		return {name: stats['queries'] for name, stats in report['client'].items()}
+
+	def test_command(self):
+		report = self.run_benchmark()
+		self.assertEqual(30, report['meta']['books'])
+		self.assertEqual(['detail', 'filter', 'list', 'ordering_rating', 'relation_patch', 'search'],
+		                 sorted(report['client']))
+		for stats in report['client'].values():
+			self.assertEqual((2, 0), (stats['requests'], stats['errors']))
+		# сессия и пользователь + запросы вьюхи; поиск вне PostgreSQL
+		# делает ещё один запрос (python_search)
+		queries = self.queries(report)
+		search = 4 if connection.vendor == 'postgresql' else 5
+		self.assertEqual({'detail': 4, 'filter': 4, 'list': 4, 'ordering_rating': 4,
+		                  'search': search}, {name: count for name, count in queries.items()
+		                                      if name != 'relation_patch'})
+		self.assertLessEqual(queries['relation_patch'],
+		                     2 + UserBookRelationView.query_budgets['partial_update'])
+		# данные откатываются
+		self.assertFalse(Book.objects.exists())
+
+	def test_unthrottled(self):
+		cache.clear()
+		with mock.patch.dict(RelationWriteThrottle.THROTTLE_RATES, {'relation_write': '1/min'}):
+			report = self.run_benchmark(response_cache=True)
+			self.assertEqual('1/min', RelationWriteThrottle.THROTTLE_RATES['relation_write'])
+		self.assertEqual(0, report['client']['relation_patch']['errors'])
+
+	def test_repeat_with_keep(self):
+		first = self.run_benchmark(keep=True)
+		second = self.run_benchmark(keep=True)
+		self.assertEqual(self.queries(first), self.queries(second))
+		self.assertEqual(10, User.objects.filter(username__startswith='bench_user_').count())
+		self.assertEqual(60, Book.objects.count())
+
+
+class BenchmarkStartupCommandTestCase(TestCase):
+	def test_command(self):
+		out = StringIO()
+		call_command('benchmark_startup', 'books.test_settings', 'books.settings_api', repeat=1,
+		             stdout=out)
+		lines = out.getvalue().splitlines()
+		self.assertEqual(['settings', 'wall_ms', 'ready_ms', 'rss_mb', 'modules', 'apps'],
+		                 lines[0].split())
+		full, api = (line.split() for line in lines[1:])
+		# без admin, sessions, messages и staticfiles
+		self.assertEqual(4, int(full[-1]) - int(api[-1]))
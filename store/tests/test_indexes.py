@@ -0,0 +1,87 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase
+
+from store.models import Book, UserBookRelation
+from store.pagination import BookCursorPagination
+
+
+class IndexUsageTestCase(TestCase):
+	def setUp(self) -> None:
+		self.user = User.objects.create(username='test_user')
+		self.book = Book.objects.create(name='TestBook1', price=25.00, author='Author 1')
+		UserBookRelation.objects.create(user=self.user, book=self.book, like=True, rate=5)
+		if connection.vendor == 'postgresql':
+			# на пустых таблицах планировщик всегда выбирает seq scan
+			with connection.cursor() as cursor:
+				cursor.execute('SET LOCAL enable_seqscan = off')
+
+	def assertUsesIndex(self, queryset, *index_names):
+		plan = queryset.explain()
+		self.assertTrue(any(name in plan for name in index_names), plan)
+
+	def assertNoSort(self, queryset):
+		plan = queryset.explain()
+		# PostgreSQL: узел Sort / Incremental Sort, SQLite: временное B-дерево
+		self.assertNotIn('Sort', plan)
+		self.assertNotIn('TEMP B-TREE', plan)
+
+	def keyset_page(self, ordering, values):
+		paginator = BookCursorPagination()
+		ordering = paginator.get_ordering(Book.objects.order_by(ordering))
+		queryset = paginator.apply_ordering(Book.objects.all(), ordering)
+		return paginator.filter_after(queryset, ordering, values)[:20]
+
+	def test_indexes_exist(self):
+		# индексы объявлены в Meta.indexes и переживают пересоздание таблицы
+		with connection.cursor() as cursor:
+			constraints = connection.introspection.get_constraints(cursor, Book._meta.db_table)
+		for name in ('store_book_price_id_idx', 'store_book_author_id_idx',
+		             'store_book_rating_id_idx'):
+			self.assertIn(name, constraints)
+
+	def test_list_filter(self):
+		self.assertUsesIndex(Book.objects.filter(price=22), 'store_book_price_id_idx')
+
+	def test_list_keyset(self):
+		self.assertUsesIndex(self.keyset_page('price', ['25.00', 1]), 'store_book_price_id_idx')
+		self.assertUsesIndex(self.keyset_page('author', ['Author 1', 1]), 'store_book_author_id_idx')
+		self.assertUsesIndex(self.keyset_page('-rating', ['4.50', 1]), 'store_book_rating_id_idx')
+
+	def test_keyset_order_from_index(self):
+		# порядок страницы берётся из индекса, без отдельной сортировки
+		for ordering, values in (('price', ['25.00', 1]), ('-price', ['25.00', 1]),
+		                         ('author', ['Author 1', 1]), ('-rating', ['4.50', 1]),
+		                         ('rating', [None, 1])):
+			with self.subTest(ordering=ordering):
+				self.assertNoSort(self.keyset_page(ordering, values))
+
+		# SQLite и так ставит NULL первыми, поэтому проверяем и сам SQL:
+		# NULLS FIRST/LAST у NOT NULL полей не даёт PostgreSQL читать индекс (поле, id)
+		order_by = str(self.keyset_page('price', ['25.00', 1]).query).split('ORDER BY')[-1]
+		self.assertNotIn('NULLS', order_by)
+		order_by = str(self.keyset_page('-rating', ['4.50', 1]).query).split('ORDER BY')[-1]
+		self.assertIn('NULLS LAST', order_by)
+
+	def test_keyset_condition(self):
+		# IS NULL в условии только у nullable-полей
+		where = str(self.keyset_page('-price', ['25.00', 1]).query).split('WHERE')[-1]
+		self.assertNotIn('IS NULL', where)
+		where = str(self.keyset_page('-rating', ['4.50', 1]).query).split('WHERE')[-1]
+		self.assertIn('"rating" IS NULL', where)
+		self.assertNotIn('"id" IS NULL', where)
+
+	def test_relation_lookup(self):
+		relations = UserBookRelation.objects.filter(user=self.user, book=self.book)
+		# SQLite хранит UNIQUE-ограничение как автоиндекс таблицы
+		self.assertUsesIndex(relations, 'store_userbookrelation_user_book_uniq',
+		                     'sqlite_autoindex_store_userbookrelation')
+
+	def test_relation_counters(self):
+		self.assertUsesIndex(UserBookRelation.objects.filter(book=self.book, like=True)
+		                     .values('book').annotate(total=Sum('book')),
+		                     'store_ubr_book_liked_idx')
+		self.assertUsesIndex(UserBookRelation.objects.filter(book=self.book, rate__isnull=False)
+		                     .values('book').annotate(total=Sum('rate')),
+		                     'store_ubr_book_rated_idx')
@@ -0,0 +1,56 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from store.instrumentation import QueryBudgetExceeded, registry
+from store.models import Book
+from store.views import BookViewSet
+
+
+class InstrumentationTestCase(APITestCase):
+	def setUp(self) -> None:
+		cache.clear()
+		registry.reset()
+		self.user = User.objects.create(username='test_user')
+		self.admin = User.objects.create(username='admin', is_staff=True)
+		Book.objects.create(name='TestBook1', price=25, author='Author 1', owner=self.user)
+
+	def test_server_timing(self):
+		resp = self.client.get(reverse('book-list'))
+		timing = resp['Server-Timing']
+		self.assertRegex(timing, r'^db;dur=[\d.]+;desc="2 queries"')
+		self.assertIn('serialize;dur=', timing)
+		self.assertIn('render;dur=', timing)
+		self.assertRegex(timing, r'total;dur=[\d.]+$')
+
+	def test_metrics(self):
+		self.client.get(reverse('book-list'))
+		self.client.get(reverse('book-list'))  # из кэша ответов
+
+		self.assertEqual(403, self.client.get(reverse('metrics')).status_code)
+		self.client.force_login(self.admin)
+		resp = self.client.get(reverse('metrics'))
+		self.assertEqual(200, resp.status_code)
+
+		metrics = resp.data['book.list']
+		self.assertEqual(2, metrics['count'])
+		self.assertEqual({'1': 1, '2': 1}, {bound: count for bound, count
+		                                    in metrics['queries']['buckets'].items() if count})
+		self.assertEqual(1, sum(metrics['serialize_ms']['buckets'].values()))
+		self.assertEqual(2, sum(metrics['total_ms']['buckets'].values()))
+
+	def test_query_budget(self):
+		url = reverse('book-list')
+		with mock.patch.object(BookViewSet, 'query_budgets', {'list': 1}):
+			with self.assertLogs('store.instrumentation', 'WARNING') as logs:
+				self.assertEqual(200, self.client.get(url).status_code)
+			self.assertIn('book.list made 2 queries, budget is 1', logs.output[0])
+
+			cache.clear()
+			with override_settings(STORE_QUERY_BUDGETS_STRICT=True):
+				with self.assertRaises(QueryBudgetExceeded):
+					self.client.get(url)
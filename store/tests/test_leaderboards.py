@@ -0,0 +1,75 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from store.leaderboards import refresh_leaderboards
+from store.models import Book, BookRank, UserBookRelation
+
+
+class LeaderboardsTestCase(APITestCase):
+	def setUp(self) -> None:
+		self.users = [User.objects.create(username=f'user_{i}') for i in range(4)]
+		self.b1 = Book.objects.create(name='TestBook1', price=25, author='Author 1')
+		self.b2 = Book.objects.create(name='TestBook2', price=19, author='Author 2')
+		self.b3 = Book.objects.create(name='TestBook3', price=30, author='Author 3')
+
+		# у b1 одна пятёрка, у b2 средняя 4.75 из четырёх оценок:
+		# байесовский рейтинг выше у b2
+		self.relate(self.b1, self.users[0], rate=5, like=True)
+		for user, rate in zip(self.users, (5, 5, 5, 4)):
+			self.relate(self.b2, user, rate=rate)
+		for user in self.users[:2]:
+			self.relate(self.b3, user, like=True, in_bookmarks=True, rate=1)
+
+	@staticmethod
+	def relate(book, user, **fields):
+		return UserBookRelation.objects.create(book=book, user=user, **fields)
+
+	def board(self, board):
+		return list(BookRank.objects.filter(board=board).order_by('position')
+		            .values_list('book_id', flat=True))
+
+	def test_refresh(self):
+		self.assertEqual({'liked': 2, 'rated': 3, 'bookmarked': 1, 'trending': 3},
+		                 refresh_leaderboards())
+		self.assertEqual([self.b3.id, self.b1.id], self.board('liked'))
+		self.assertEqual([self.b2.id, self.b1.id, self.b3.id], self.board('rated'))
+		self.assertEqual([self.b3.id], self.board('bookmarked'))
+		self.assertEqual([self.b2.id, self.b3.id, self.b1.id], self.board('trending'))
+
+		# старые связи выпадают из окна trending
+		UserBookRelation.objects.filter(book=self.b2).update(
+			updated_at=timezone.now() - timedelta(days=30))
+		refresh_leaderboards(['trending'])
+		self.assertEqual([self.b3.id, self.b1.id], self.board('trending'))
+
+	def test_command(self):
+		out = StringIO()
+		call_command('refresh_leaderboards', board=['liked'], stdout=out)
+		self.assertEqual('liked: 2 books\n', out.getvalue())
+		self.assertFalse(BookRank.objects.exclude(board='liked').exists())
+
+	def test_endpoint(self):
+		refresh_leaderboards()
+		url = reverse('leaderboard-detail', args=('rated',))
+		with CaptureQueriesContext(connection) as queries:
+			resp = self.client.get(url, data={'limit': 1})
+			self.assertEqual(1, len(queries))
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertEqual('rated', resp.data['board'])
+		[rank] = resp.data['results']
+		self.assertEqual(1, rank['position'])
+		self.assertEqual('TestBook2', rank['book']['name'])
+
+		self.assertEqual(status.HTTP_400_BAD_REQUEST,
+		                 self.client.get(url, data={'limit': 'x'}).status_code)
+		self.assertEqual(status.HTTP_404_NOT_FOUND,
+		                 self.client.get('/leaderboard/unknown/').status_code)
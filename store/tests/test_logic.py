@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from store.logic import refresh_book_stats
+from store.models import Book, BookStats, UserBookRelation
+
+
+class BookCountersTestCase(TestCase):
+	def setUp(self) -> None:
+		self.user1 = User.objects.create(username='test_user1')
+		self.user2 = User.objects.create(username='test_user2')
+		self.book = Book.objects.create(name='TestBook1', price=25.00,
+		                                author='Author 1')
+
+	def test_delete_relation(self):
+		UserBookRelation.objects.create(user=self.user1, book=self.book,
+		                                like=True, rate=5)
+		relation = UserBookRelation.objects.create(user=self.user2, book=self.book,
+		                                           like=True, rate=2)
+		relation.delete()
+
+		self.book.refresh_from_db()
+		self.assertEqual(1, self.book.likes_count)
+		self.assertEqual(Decimal('5.00'), self.book.rating)
+
+	def test_delete_user(self):
+		UserBookRelation.objects.create(user=self.user1, book=self.book,
+		                                like=True, in_bookmarks=True, rate=5)
+		UserBookRelation.objects.create(user=self.user2, book=self.book, rate=2)
+		# каскадное удаление связей тоже меняет счётчики
+		self.user1.delete()
+
+		self.book.refresh_from_db()
+		self.assertEqual((0, 2, 1, Decimal('2.00')), (self.book.likes_count, self.book.rates_sum,
+		                                              self.book.rates_count, self.book.rating))
+		stats = BookStats.objects.get(book=self.book)
+		self.assertEqual((0, 0, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0}),
+		                 (stats.likes, stats.bookmarks, stats.rates))
+
+		UserBookRelation.objects.all().delete()
+		self.book.refresh_from_db()
+		self.assertEqual((0, None), (self.book.rates_count, self.book.rating))
+
+	def test_save_keeps_counters(self):
+		book = Book.objects.get(pk=self.book.pk)
+		# лайк, пришедший после загрузки книги (например, во время PATCH /book/)
+		UserBookRelation.objects.create(user=self.user1, book=self.book, like=True, rate=4)
+		book.price = 30
+		book.save()
+
+		self.book.refresh_from_db()
+		self.assertEqual((1, 1, Decimal('4.00')),
+		                 (self.book.likes_count, self.book.rates_count, self.book.rating))
+		self.assertEqual(Decimal('30.00'), self.book.price)
+
+	def test_stats(self):
+		relation = UserBookRelation.objects.create(user=self.user1, book=self.book,
+		                                           like=True, rate=5)
+		UserBookRelation.objects.create(user=self.user2, book=self.book,
+		                                in_bookmarks=True, rate=5)
+		relation.rate = 3
+		relation.in_bookmarks = True
+		relation.save()
+
+		stats = BookStats.objects.get(book=self.book)
+		self.assertEqual((1, 2), (stats.likes, stats.bookmarks))
+		self.assertEqual({1: 0, 2: 0, 3: 1, 4: 0, 5: 1}, stats.rates)
+
+		# пересчёт с нуля даёт то же, что и инкрементальные изменения
+		BookStats.objects.all().delete()
+		refresh_book_stats()
+		self.assertEqual(stats.rates, BookStats.objects.get(book=self.book).rates)
+
+		UserBookRelation.objects.all().delete()
+		self.assertEqual({1: 0, 2: 0, 3: 0, 4: 0, 5: 0},
+		                 BookStats.objects.get(book=self.book).rates)
+		refresh_book_stats(Book.objects.filter(pk=self.book.pk))
+		self.assertFalse(BookStats.objects.exists())
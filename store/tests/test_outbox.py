@@ -0,0 +1,86 @@
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from rest_framework.utils import json
+
+from store.models import Book, BookStats, RelationOutbox, UserBookRelation
+
+
+@override_settings(STORE_RELATION_WRITE_BEHIND=True, STORE_QUERY_BUDGETS_STRICT=True)
+class WriteBehindTestCase(APITestCase):
+	def setUp(self) -> None:
+		self.user = User.objects.create(username='test_user')
+		self.user2 = User.objects.create(username='test_user_2')
+		self.book = Book.objects.create(name='TestBook1', price=25, author='Author 1')
+		self.client.force_login(self.user)
+
+	def patch(self, data, book=None):
+		url = reverse('userbookrelation-detail', args=(book or self.book.id,))
+		return self.client.patch(url, data=json.dumps(data), content_type='application/json')
+
+	def test_enqueue_and_process(self):
+		for data in ({'like': True}, {'rate': 4}, {'like': False}, {'like': True}):
+			resp = self.patch(data)
+			self.assertEqual(status.HTTP_202_ACCEPTED, resp.status_code)
+		self.assertEqual({'book': self.book.id, 'like': True}, resp.data)
+		self.client.force_login(self.user2)
+		self.patch({'in_bookmarks': True})
+
+		self.assertFalse(UserBookRelation.objects.exists())
+		self.assertEqual(5, RelationOutbox.objects.count())
+
+		out = StringIO()
+		call_command('process_relation_outbox', batch_size=2, stdout=out)
+		self.assertEqual('Applied 5 relation changes\n', out.getvalue())
+		self.assertFalse(RelationOutbox.objects.exists())
+
+		relation = UserBookRelation.objects.get(user=self.user)
+		self.assertEqual((True, False, 4), (relation.like, relation.in_bookmarks, relation.rate))
+		self.assertTrue(UserBookRelation.objects.get(user=self.user2).in_bookmarks)
+		self.book.refresh_from_db()
+		self.assertEqual((1, 4), (self.book.likes_count, self.book.rates_sum))
+		self.assertEqual(1, BookStats.objects.get(book=self.book).bookmarks)
+
+	def test_batch_updates_counters_once(self):
+		users = [User.objects.create(username=f'reader_{i}') for i in range(10)]
+		for user in users:
+			self.client.force_login(user)
+			self.patch({'like': True, 'rate': 4})
+
+		with CaptureQueriesContext(connection) as queries:
+			call_command('process_relation_outbox', stdout=StringIO())
+		# счётчики книги сдвигаются одной пачкой, без пересчёта по связям
+		book_updates = [query['sql'] for query in queries
+		                if query['sql'].startswith('UPDATE "store_book" ')]
+		self.assertEqual(2, len(book_updates))
+		self.assertFalse(any('SUM(' in query['sql'].upper() for query in queries))
+
+		self.book.refresh_from_db()
+		self.assertEqual((10, 40, 10), (self.book.likes_count, self.book.rates_sum,
+		                                self.book.rates_count))
+		stats = BookStats.objects.get(book=self.book)
+		self.assertEqual((10, 10), (stats.likes, stats.rates[4]))
+
+	def test_invalid(self):
+		self.assertEqual(status.HTTP_400_BAD_REQUEST, self.patch({'rate': 10}).status_code)
+		self.assertEqual(status.HTTP_404_NOT_FOUND, self.patch({'like': True}, 100500).status_code)
+		self.assertFalse(RelationOutbox.objects.exists())
+
+	def test_read_your_writes(self):
+		self.patch({'like': True, 'rate': 5})
+
+		resp = self.client.get(reverse('library-list'))
+		self.assertEqual([self.book.id], [item['book']['id'] for item in resp.data['results']])
+		self.assertEqual(1, resp.data['results'][0]['book']['likes_count'])
+
+		self.patch({'like': False})
+		resp = self.client.get(reverse('book-list'), data={'expand': 'relation'})
+		self.assertEqual({'like': False, 'in_bookmarks': False, 'rate': 5}, resp.data[0]['relation'])
+		self.assertFalse(RelationOutbox.objects.exists())
@@ -0,0 +1,120 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITransactionTestCase
+from rest_framework.utils import json
+
+from store.models import Book
+from store.routers import READ_YOUR_WRITES_KEY, ReplicaRouter
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'needs a replica, see books/test_settings.py')
+class ReplicaRoutingTestCase(APITransactionTestCase):
+	# реплика - зеркало основной БД; вне транзакции TestCase она видит записи
+	databases = {'default', *settings.DATABASE_REPLICAS}
+
+	def setUp(self) -> None:
+		cache.clear()
+		self.user = User.objects.create(username='test_user')
+		self.other = User.objects.create(username='other_user')
+		self.book = Book.objects.create(name='TestBook1', price=25, author='Author 1')
+		self.replica = settings.DATABASE_REPLICAS[0]
+
+	def request(self, method, url, **kwargs):
+		with CaptureQueriesContext(connections['default']) as default, \
+				CaptureQueriesContext(connections[self.replica]) as replica:
+			resp = getattr(self.client, method)(url, **kwargs)
+		return resp, len(default), len(replica)
+
+	def test_reads_go_to_replica(self):
+		resp, default, replica = self.request('get', reverse('book-list'))
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertEqual((0, 2), (default, replica))
+
+	def test_streamed_reads_go_to_replica(self):
+		# тело StreamingHttpResponse читается после выхода из middleware
+		for url, data in ((reverse('book-list'), {'stream': 'true'}),
+		                  (reverse('book-export-books'), {'file_format': 'jsonl'})):
+			with self.subTest(url=url), \
+					CaptureQueriesContext(connections['default']) as default, \
+					CaptureQueriesContext(connections[self.replica]) as replica:
+				resp = self.client.get(url, data=data)
+				content = b''.join(resp.streaming_content)
+			self.assertIn(b'TestBook1', content)
+			self.assertEqual(0, len(default))
+			self.assertGreater(len(replica), 0)
+
+	def test_read_your_writes(self):
+		url = reverse('userbookrelation-detail', args=(self.book.id,))
+		self.client.force_login(self.user)
+		resp, default, replica = self.request('patch', url, data=json.dumps({'like': True}),
+		                                      content_type='application/json')
+		self.assertEqual(status.HTTP_200_OK, resp.status_code)
+		self.assertEqual(0, replica)
+
+		# автор изменения читает из основной БД, на реплику идут
+		# только запросы сессии и пользователя
+		resp, default, replica = self.request('get', reverse('book-list'),
+		                                      data={'expand': 'relation'})
+		self.assertTrue(resp.data[0]['relation']['like'])
+		self.assertEqual((2, 2), (default, replica))
+
+		# остальные пользователи - с реплики
+		self.client.force_login(self.other)
+		resp, default, replica = self.request('get', reverse('book-list'),
+		                                      data={'expand': 'relation'})
+		self.assertEqual((0, 4), (default, replica))
+
+		# по истечении окна и автор читает с реплики
+		cache.delete(READ_YOUR_WRITES_KEY.format(self.user.pk))
+		self.client.force_login(self.user)
+		resp, default, replica = self.request('get', reverse('book-list'),
+		                                      data={'expand': 'relation', 'ordering': 'price'})
+		self.assertEqual((0, 4), (default, replica))
+
+	def test_response_cache_during_replica_lag(self):
+		url = reverse('book-detail', args=(self.book.id,))
+		# книга только что создана: реплика могла ещё не получить её,
+		# поэтому ответ с реплики не кэшируется и отдаётся без ETag
+		resp, default, replica = self.request('get', url)
+		self.assertNotIn('ETag', resp)
+		resp, default, replica = self.request('get', url)
+		self.assertEqual((0, 2), (default, replica))
+
+		# автор изменения читает из основной БД мимо кэша: не берёт из него
+		# ответ, закэшированный до изменения, и не кладёт в него свой
+		relation_url = reverse('userbookrelation-detail', args=(self.book.id,))
+		self.client.force_login(self.user)
+		self.request('patch', relation_url, data=json.dumps({'like': True}),
+		             content_type='application/json')
+		for _ in range(2):
+			resp, default, replica = self.request('get', url)
+			self.assertEqual(1, resp.data['likes_count'])
+			self.assertNotIn('ETag', resp)
+			self.assertEqual(2, default)
+
+		# после окна отставания ответ кэшируется
+		self.client.logout()
+		with override_settings(STORE_READ_YOUR_WRITES_SECONDS=0):
+			resp, default, replica = self.request('get', url)
+			self.assertEqual((0, 2), (default, replica))
+			self.assertIn('ETag', resp)
+			resp, default, replica = self.request('get', url)
+			self.assertEqual((0, 0), (default, replica))
+
+	def test_primary(self):
+		router = ReplicaRouter()
+		self.assertEqual('default', router.db_for_read(Book))
+		with override_settings(DATABASE_REPLICAS=[]):
+			resp, default, replica = self.request('get', reverse('book-list'))
+			self.assertEqual((2, 0), (default, replica))
+		with transaction.atomic():
+			self.assertEqual('default', router.db_for_read(Book))
+		self.assertFalse(router.allow_migrate(self.replica, 'store'))
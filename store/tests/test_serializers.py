@@ -1,5 +1,4 @@
 from django.contrib.auth.models import User
-from django.db.models import Count, Case, When, Avg
 from django.test import TestCase
 
 from store.models import Book, UserBookRelation
@@ -28,10 +27,7 @@ class BookSerializerTestCase(TestCase):
 		UserBookRelation.objects.create(user=user2, book=b2, like=False, rate=4)
 		UserBookRelation.objects.create(user=user3, book=b2, like=True)
 
-		books = Book.objects.annotate(
-			likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-			rating=Avg('userbookrelation__rate')
-		).order_by('id')
+		books = Book.objects.order_by('id')
 
 		data = BooksSerializer(books, many=True).data
 		expected_data = [
@@ -0,0 +1,17 @@
+from rest_framework.throttling import UserRateThrottle
+
+from store.routers import SAFE_METHODS
+
+
+class RelationWriteThrottle(UserRateThrottle):
+	"""
+	Ограничивает изменения связей пользователя с книгами (по пользователю,
+	для анонимных - по IP), чтобы всплески записей не вытесняли чтения.
+	Частота - DEFAULT_THROTTLE_RATES['relation_write'].
+	"""
+	scope = 'relation_write'
+
+	def allow_request(self, request, view):
+		if request.method in SAFE_METHODS:
+			return True
+		return super().allow_request(request, view)
@@ -1,46 +1,411 @@
-from django.db.models import Count, Case, When, Avg
-from rest_framework.filters import OrderingFilter, SearchFilter
-from rest_framework.mixins import UpdateModelMixin
-from rest_framework.permissions import IsAuthenticated
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Prefetch, Q
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.authtoken.serializers import AuthTokenSerializer
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.mixins import ListModelMixin, UpdateModelMixin
+from rest_framework.pagination import _positive_int
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
 from django_filters.rest_framework import DjangoFilterBackend
 
-from store.models import Book, UserBookRelation
+from store import importers
+from store.authentication import issue_token
+from store.cache import CachedResponseMixin
+from store.filters import BookFilter, BookSearchFilter
+from store.instrumentation import InstrumentedViewMixin, registry
+from store.logic import readers_count, readers_preview, upsert_relations, with_user_relation
+from store.leaderboards import BOARDS
+from store.models import Book, BookRank, UserBookRelation
+from store.outbox import enqueue_relation_change, flush_user_relations, write_behind_enabled
+from store.pagination import BookCursorPagination, LibraryCursorPagination, \
+	ReadersCursorPagination
+from store.parsers import CSVStreamParser, JSONLinesStreamParser
 from store.permissions import IsOwnerOrStaffOrReadOnly
-from store.serializers import BooksSerializer, UserBookRelationSerializer
+from store.routers import ReadYourWritesMixin
+from store.serializers import BooksSerializer, UserBookRelationSerializer, \
+	BooksReadersPreviewSerializer, BookReaderRelationSerializer, BooksFastSerializer, \
+	BookStatsSerializer, BookRankSerializer, LibraryItemSerializer, RelationBulkItemSerializer
+from store.streaming import EXPORT_FORMATS, stream_export, stream_json_list
+from store.throttling import RelationWriteThrottle
 
 
 # pip install django-filter
 # filter_backend можно устновить для всего проекта в settings
 
 
-class BookViewSet(ModelViewSet):
-	queryset = Book.objects.annotate(
-			likes_count=Count(Case(When(userbookrelation__like=True, then=1))),
-			rating=Avg('userbookrelation__rate')
-		).select_related('owner').prefetch_related('readers')
+class BookViewSet(ReadYourWritesMixin, InstrumentedViewMixin, CachedResponseMixin, ModelViewSet):
+	readers_prefetch = Prefetch('readers', queryset=User.objects.only(
+		'id', 'first_name', 'last_name').order_by('userbookrelation__id'))
+	# likes_count и rating хранятся в Book, агрегаты по связям не нужны
+	queryset = Book.objects.defer('search_vector').select_related('owner') \
+		.prefetch_related(readers_prefetch)
 
 	serializer_class = BooksSerializer
-	filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+	pagination_class = BookCursorPagination
+	filter_backends = [DjangoFilterBackend, BookSearchFilter, OrderingFilter]
 	permission_classes = [IsOwnerOrStaffOrReadOnly]
-	filterset_fields = ['price']
+	filterset_class = BookFilter
 	search_fields = ['name', 'author']
 	ordering_fields = ['price', 'author', 'rating']
+	# ?readers=preview - вместо всех читателей первые readers_preview_size
+	readers_preview_size = 5
+	stream_chunk_size = 500
+	last_modified_field = 'updated_at'
+	# список строится BooksFastSerializer из .values(), см. STORE_FAST_BOOK_LIST
+	fast_list = settings.STORE_FAST_BOOK_LIST
+	# без запросов аутентификации; +1 на list для поиска вне PostgreSQL (python_search)
+	# update: книга для проверки прав, UPDATE, книга и читатели для ответа
+	# destroy: книга, связи (у них есть сигналы), 5 DELETE
+	query_budgets = {'list': 3, 'retrieve': 2, 'readers': 2, 'stats': 1, 'create': 3,
+	                 'update': 4, 'partial_update': 4, 'destroy': 7}
+	update_actions = ('update', 'partial_update')
+
+	def get_queryset(self):
+		if self.action == 'readers':
+			return Book.objects.only('id')
+		if self.action == 'stats':
+			return Book.objects.only('id').select_related('stats')
+		if self.action == 'export_books':
+			return Book.objects.order_by('id')
+		if self.action == 'destroy':
+			# только проверка владельца и удаление
+			return Book.objects.only('id', 'owner_id')
+		if self.action in self.update_actions:
+			# проверка владельца и сохранение, ответ строит response_queryset
+			return Book.objects.only('id', 'owner_id', 'updated_at', *self.writable_columns())
+		return self.response_queryset()
+
+	def response_queryset(self):
+		queryset = super().get_queryset().prefetch_related(None)
+		if self.fast_list_requested():
+			return queryset.values(*BooksFastSerializer.value_fields)
+
+		fields = self.response_fields()
+		queryset = queryset.prefetch_related(*self.response_prefetch(fields))
+		if 'readers_count' in fields:
+			queryset = queryset.annotate(readers_count=readers_count())
+		if 'owner_name' not in fields:
+			queryset = queryset.select_related(None)
+		if self.sparse_fields_requested():
+			queryset = queryset.defer(*self.unused_columns(fields))
+
+		expand = self.expanded_fields()
+		if 'stats' in expand:
+			queryset = queryset.select_related('stats')
+		if 'relation' in expand and self.request.user.is_authenticated:
+			queryset = with_user_relation(queryset, self.request.user)
+		return queryset
+
+	def response_prefetch(self, fields):
+		if 'readers' not in fields:
+			return []
+		if self.readers_preview_requested():
+			return [readers_preview(self.readers_preview_size)]
+		return [self.readers_prefetch]
+
+	def update(self, request, *args, **kwargs):
+		# как UpdateModelMixin.update, но книга для проверки прав и сохранения
+		# загружается без связанных данных, а ответ строится после
+		# сохранения тем же queryset, что и для чтения
+		partial = kwargs.pop('partial', False)
+		instance = self.get_object()
+		serializer = self.get_serializer(instance, data=request.data, partial=partial)
+		serializer.is_valid(raise_exception=True)
+		self.perform_update(serializer)
+		instance = self.response_queryset().get(pk=instance.pk)
+		return Response(self.get_serializer(instance).data)
+
+	def writable_columns(self):
+		# без контекста: ?fields= / ?exclude= не сужают принимаемые поля
+		serializer = self.get_serializer_class()()
+		return [field.source for field in serializer.fields.values() if not field.read_only]
+
+	def response_fields(self):
+		"""Имена полей, которые попадут в ответ сериализатора."""
+		return set(self.get_serializer().fields)
+
+	def unused_columns(self, fields):
+		"""Колонки Book, не нужные для ?fields= / ?exclude=, сортировки и Last-Modified."""
+		serializer_fields = self.get_serializer().fields
+		used = {'id', 'updated_at', *self.ordering_fields}
+		used.update(serializer_fields[name].source for name in fields)
+		if 'owner_name' in fields:
+			used.add('owner')
+		return [field.name for field in Book._meta.concrete_fields if field.name not in used]
+
+	def initial(self, request, *args, **kwargs):
+		# до поиска в кэше ответов: отложенные изменения связей меняют версию книг;
+		# запросы flush не входят в query_budgets
+		if 'relation' in self.expanded_fields():
+			flush_user_relations(request.user)
+		super().initial(request, *args, **kwargs)
+
+	def get_serializer_class(self):
+		if self.readers_preview_requested():
+			return BooksReadersPreviewSerializer
+		if self.fast_list_requested():
+			return BooksFastSerializer
+		return super().get_serializer_class()
+
+	def get_serializer_context(self):
+		context = super().get_serializer_context()
+		context['expand'] = self.expanded_fields()
+		context['fields'], context['exclude'] = self.sparse_fields()
+		return context
+
+	def get_response_cache_vary(self, request):
+		# ?expand=relation у каждого пользователя свой
+		if 'relation' in self.expanded_fields():
+			return [f'user:{request.user.pk}']
+		return []
+
+	def expanded_fields(self):
+		"""?expand=stats,relation - дополнительные поля BooksSerializer."""
+		expand = self.request.query_params.get('expand', '')
+		return {name for name in expand.split(',') if name in BooksSerializer.expandable_fields}
+
+	def sparse_fields(self):
+		"""?fields=id,name и ?exclude=readers: (оставляемые поля или None, исключаемые поля)."""
+		params = self.request.query_params
+		fields = params.get('fields')
+		if fields is not None:
+			fields = {name for name in fields.split(',') if name}
+		return fields, {name for name in params.get('exclude', '').split(',') if name}
+
+	def sparse_fields_requested(self):
+		return self.sparse_fields() != (None, set())
+
+	def fast_list_requested(self):
+		# ?readers=preview - другие поля (readers_count), их .values() не даёт
+		return self.fast_list and self.action == 'list' \
+			and not self.expanded_fields() and not self.sparse_fields_requested() \
+			and not self.readers_preview_requested()
+
+	def list(self, request, *args, **kwargs):
+		# ?stream=true - список без пагинации отдаётся по частям, мимо кэша
+		if request.query_params.get('stream') == 'true' \
+				and self.paginator.get_page_size(request) is None:
+			return self.stream_list(request)
+		return super().list(request, *args, **kwargs)
+
+	def stream_list(self, request):
+		queryset = self.filter_queryset(self.get_queryset())
+		content = stream_json_list(queryset, self.get_serializer_class(),
+		                           context=self.get_serializer_context(),
+		                           chunk_size=self.stream_chunk_size)
+		return StreamingHttpResponse(content, content_type='application/json')
+
+	def readers_preview_requested(self):
+		return self.request.query_params.get('readers') == 'preview'
+
+	@action(detail=True)
+	def readers(self, request, pk=None):
+		book = self.get_object()
+		relations = UserBookRelation.objects.filter(book=book).select_related('user')
+		paginator = ReadersCursorPagination()
+		page = paginator.paginate_queryset(relations, request, view=self)
+		serializer = BookReaderRelationSerializer(page, many=True)
+		return paginator.get_paginated_response(serializer.data)
+
+	@action(detail=True)
+	def stats(self, request, pk=None):
+		"""Распределение оценок, лайки и закладки книги."""
+		book = self.get_object()
+		return Response(BookStatsSerializer(book.current_stats).data)
+
+	@action(detail=False, methods=['post'], url_path='import',
+	        permission_classes=[IsAuthenticated],
+	        parser_classes=[CSVStreamParser, JSONLinesStreamParser])
+	def import_books(self, request):
+		"""Потоковый импорт книг из CSV (text/csv) или JSON Lines (application/x-ndjson)."""
+		report = importers.import_books(request.data, owner=request.user)
+		return Response(report)
+
+	@action(detail=False, url_path='export')
+	def export_books(self, request):
+		"""Потоковый экспорт книг: ?file_format=csv|jsonl, фильтры как у списка."""
+		file_format = request.query_params.get('file_format', 'csv')
+		if file_format not in EXPORT_FORMATS:
+			raise ValidationError({'file_format': [f'Expected one of: {", ".join(EXPORT_FORMATS)}.']})
+
+		queryset = self.filter_queryset(self.get_queryset())
+		content_type = 'text/csv' if file_format == 'csv' else 'application/x-ndjson'
+		response = StreamingHttpResponse(stream_export(queryset, file_format),
+		                                 content_type=content_type)
+		response['Content-Disposition'] = f'attachment; filename="books.{file_format}"'
+		return response
 
 	def perform_create(self, serializer):
 		serializer.validated_data['owner'] = self.request.user
 		serializer.save()
 
 
-class UserBookRelationView(UpdateModelMixin, GenericViewSet):
+class LeaderboardViewSet(InstrumentedViewMixin, GenericViewSet):
+	"""
+	/leaderboard/<board>/?limit=N - первые N позиций рейтинга из BookRank,
+	который пересчитывает команда refresh_leaderboards.
+	"""
+	queryset = BookRank.objects.select_related('book', 'book__owner').order_by('position')
+	serializer_class = BookRankSerializer
+	lookup_field = 'board'
+	lookup_value_regex = '|'.join(BOARDS)
+	default_limit = 20
+	max_limit = 100
+	query_budgets = {'retrieve': 1}
+
+	def retrieve(self, request, board=None):
+		try:
+			limit = _positive_int(request.query_params.get('limit', self.default_limit),
+			                      strict=True, cutoff=self.max_limit)
+		except ValueError:
+			raise ValidationError({'limit': ['Expected a positive integer.']})
+		ranks = self.get_queryset().filter(board=board)[:limit]
+		return Response({'board': board, 'results': self.get_serializer(ranks, many=True).data})
+
+
+class LibraryViewSet(ReadYourWritesMixin, InstrumentedViewMixin, ListModelMixin, GenericViewSet):
+	"""
+	/me/library/?shelf=bookmarks|likes|rated - книги текущего пользователя
+	со счётчиками, одним запросом на страницу.
+	"""
+	permission_classes = [IsAuthenticated]
+	serializer_class = LibraryItemSerializer
+	pagination_class = LibraryCursorPagination
+	shelves = {
+		'bookmarks': Q(in_bookmarks=True),
+		'likes': Q(like=True),
+		'rated': Q(rate__isnull=False),
+	}
+	query_budgets = {'list': 1}
+
+	def initial(self, request, *args, **kwargs):
+		flush_user_relations(request.user)
+		super().initial(request, *args, **kwargs)
+
+	def get_queryset(self):
+		queryset = UserBookRelation.objects.filter(user=self.request.user) \
+			.select_related('book', 'book__owner').defer('book__search_vector')
+		shelf = self.request.query_params.get('shelf')
+		if shelf is None:
+			# get_or_create в book_relation оставляет пустые связи
+			condition = Q()
+			for shelf_condition in self.shelves.values():
+				condition |= shelf_condition
+			return queryset.filter(condition)
+		if shelf not in self.shelves:
+			raise ValidationError({'shelf': [f'Expected one of: {", ".join(self.shelves)}.']})
+		return queryset.filter(self.shelves[shelf])
+
+
+class MetricsView(APIView):
+	"""Гистограммы запросов и времени ответа по эндпоинтам этого процесса."""
+	permission_classes = [IsAdminUser]
+
+	def get(self, request):
+		return Response(registry.snapshot())
+
+
+class TokenView(APIView):
+	"""POST username и password - токен для заголовка Authorization: Token ..."""
+	authentication_classes = []
+	permission_classes = [AllowAny]
+
+	def post(self, request):
+		serializer = AuthTokenSerializer(data=request.data, context={'request': request})
+		serializer.is_valid(raise_exception=True)
+		return Response({'token': issue_token(serializer.validated_data['user']),
+		                 'expires_in': settings.STORE_TOKEN_MAX_AGE})
+
+
+class UserBookRelationView(InstrumentedViewMixin, UpdateModelMixin, GenericViewSet):
 	permission_classes = [IsAuthenticated]
+	throttle_classes = [RelationWriteThrottle]
 	queryset = UserBookRelation.objects.all()
 	serializer_class = UserBookRelationSerializer
 	lookup_field = 'book'
 
+	bulk_max_items = 1000
+	# get_or_create связи с savepoint, сохранение, счётчики книги и BookStats
+	# (новая связь обновляет updated_at книги, для первой связи книги
+	# строка BookStats считается заново)
+	query_budgets = {'update': 15, 'partial_update': 15}
+
+	def update(self, request, *args, **kwargs):
+		if write_behind_enabled():
+			return self.enqueue_update(request, partial=kwargs.get('partial', False))
+		flush_user_relations(request.user)
+		return super().update(request, *args, **kwargs)
+
+	def enqueue_update(self, request, partial):
+		"""STORE_RELATION_WRITE_BEHIND: изменение ставится в очередь, ответ 202."""
+		try:
+			book_id = int(self.kwargs['book'])
+		except ValueError:
+			raise NotFound
+		if not Book.objects.filter(pk=book_id).exists():
+			raise NotFound
+
+		serializer = self.get_serializer(data=request.data, partial=partial)
+		serializer.is_valid(raise_exception=True)
+		changes = {name: value for name, value in serializer.validated_data.items()
+		           if name != 'book'}
+		enqueue_relation_change(request.user, book_id, changes)
+		return Response(dict(changes, book=book_id), status=status.HTTP_202_ACCEPTED)
+
 	def get_object(self):
 		obj, created = UserBookRelation.objects.get_or_create(
 			user=self.request.user,
 			book_id=self.kwargs['book'])
 		return obj
 
+	@action(detail=False, methods=['post'])
+	def bulk(self, request):
+		"""
+		Пакетное изменение связей: [{"book": 1, "like": true}, ...].
+		Ошибка в одном элементе не мешает применить остальные.
+		"""
+		items = request.data
+		if not isinstance(items, list):
+			raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+		if len(items) > self.bulk_max_items:
+			raise ValidationError({'non_field_errors': [
+				f'Ensure this list has no more than {self.bulk_max_items} items.']})
+
+		# элемент не той формы - ошибка всего запроса, а не одного элемента
+		shape = RelationBulkItemSerializer(data=items, many=True)
+		if not shape.is_valid():
+			raise ValidationError(shape.errors)
+
+		context = self.get_serializer_context()
+		context['books'] = Book.objects.only('id').in_bulk(
+			{item['book'] for item in shape.validated_data})
+		serializer = self.get_serializer(data=items, many=True, partial=True,
+		                                 context=context)
+
+		results, valid = [], []
+		for item in items:
+			try:
+				validated = serializer.child.run_validation(item)
+			except ValidationError as exc:
+				results.append({'book': item['book'], 'status': 'invalid', 'errors': exc.detail})
+			else:
+				results.append({'book': validated['book'].pk})
+				valid.append(validated)
+
+		# более ранние отложенные изменения не должны перезаписать эти
+		flush_user_relations(request.user)
+		with transaction.atomic():
+			created = upsert_relations(request.user, valid)
+		for result in results:
+			if 'status' not in result:
+				result['status'] = 'created' if result['book'] in created else 'updated'
+		return Response({'results': results})
+